@@ -3,9 +3,13 @@ MQute - A Python package for MQute
 """
 
 from .router import Router
-from .response import Response, JsonResponse, ErrorResponse
+from .response import Response, JsonResponse, ErrorResponse, ArrayResponse
 from .request import Request
 from .mqute import MQute
+from .compression import Compression
+from .dispatch import PriorityDispatcher
+from .reconnect import ReconnectPolicy
+from .tracing import Tracer, SpanExporter, FileSpanExporter, InMemorySpanExporter
 
 
 __all__ = [
@@ -14,7 +18,15 @@ __all__ = [
     'Response',
     'JsonResponse',
     'ErrorResponse',
+    'ArrayResponse',
     'Request',
+    'Compression',
+    'PriorityDispatcher',
+    'ReconnectPolicy',
+    'Tracer',
+    'SpanExporter',
+    'FileSpanExporter',
+    'InMemorySpanExporter',
 ]
 
 __version__ = "0.1.0" 
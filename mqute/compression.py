@@ -0,0 +1,196 @@
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - optional dependency
+    lz4_frame = None
+
+CONTENT_ENCODING = "content-encoding"
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+
+
+class Codec(ABC):
+    """Abstract base class for payload compression codecs"""
+    name: str = ""
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def decompress(self, data: bytes, max_size: Optional[int] = None) -> bytes:
+        """Decompress a payload. Raises ValueError if it would inflate past `max_size` bytes"""
+        pass
+
+    @staticmethod
+    def _limit(max_size: Optional[int]) -> Optional[int]:
+        """How much output to ask for so that an oversize payload shows up as one byte too many"""
+        return None if max_size is None else max_size + 1
+
+    @staticmethod
+    def _check_size(data: bytes, max_size: Optional[int]) -> bytes:
+        if max_size is not None and len(data) > max_size:
+            raise ValueError(f"Decompressed payload exceeds {max_size} bytes")
+        return data
+
+
+class ZlibCodec(Codec):
+    """zlib codec from the standard library, with optional preset dictionary.
+
+    The (de)compression objects are primed once, dictionary included, and
+    copied for every payload.
+    """
+    name = "zlib"
+
+    def __init__(self, level: Optional[int] = None, dictionary: Optional[bytes] = None):
+        level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        if dictionary is None:
+            self._compressor = zlib.compressobj(level)
+            self._decompressor = zlib.decompressobj()
+        else:
+            self._compressor = zlib.compressobj(level, zdict=dictionary)
+            self._decompressor = zlib.decompressobj(zdict=dictionary)
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = self._compressor.copy()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes, max_size: Optional[int] = None) -> bytes:
+        decompressor = self._decompressor.copy()
+        output = self._check_size(decompressor.decompress(data, self._limit(max_size) or 0), max_size)
+        if not decompressor.eof:
+            raise ValueError("Truncated zlib payload")
+        return output
+
+
+class ZstdCodec(Codec):
+    """zstd codec (requires `zstandard`). Contexts are reused per thread"""
+    name = "zstd"
+
+    def __init__(self, level: Optional[int] = None, dictionary: Optional[bytes] = None):
+        if zstandard is None:
+            raise ImportError("zstd compression requires the 'zstandard' package")
+        self._level = 3 if level is None else level
+        self._dictionary = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        self._local = threading.local()
+
+    def _contexts(self) -> Tuple[Any, Any]:
+        contexts = getattr(self._local, 'contexts', None)
+        if contexts is None:
+            contexts = (
+                zstandard.ZstdCompressor(level=self._level, dict_data=self._dictionary),
+                zstandard.ZstdDecompressor(dict_data=self._dictionary),
+            )
+            self._local.contexts = contexts
+        return contexts
+
+    def compress(self, data: bytes) -> bytes:
+        return self._contexts()[0].compress(data)
+
+    def decompress(self, data: bytes, max_size: Optional[int] = None) -> bytes:
+        if max_size is None:
+            return self._contexts()[1].decompress(data)
+        # Streamed, so the frame's declared content size can't make us allocate more
+        chunks, size = [], 0
+        with self._contexts()[1].stream_reader(data) as reader:
+            while size <= max_size:
+                chunk = reader.read(max_size + 1 - size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+        return self._check_size(b"".join(chunks), max_size)
+
+
+class Lz4Codec(Codec):
+    """lz4 frame codec (requires `lz4`)"""
+    name = "lz4"
+
+    def __init__(self, level: Optional[int] = None, dictionary: Optional[bytes] = None):
+        if lz4_frame is None:
+            raise ImportError("lz4 compression requires the 'lz4' package")
+        if dictionary is not None:
+            raise ValueError("lz4 codec does not support dictionaries")
+        self._level = 0 if level is None else level
+
+    def compress(self, data: bytes) -> bytes:
+        return lz4_frame.compress(data, compression_level=self._level)
+
+    def decompress(self, data: bytes, max_size: Optional[int] = None) -> bytes:
+        decompressor = lz4_frame.LZ4FrameDecompressor()
+        limit = self._limit(max_size)
+        output = self._check_size(decompressor.decompress(data, max_length=-1 if limit is None else limit), max_size)
+        if not decompressor.eof:
+            raise ValueError("Truncated lz4 payload")
+        return output
+
+
+CODECS = {
+    ZlibCodec.name: ZlibCodec,
+    ZstdCodec.name: ZstdCodec,
+    Lz4Codec.name: Lz4Codec,
+}
+
+
+def available_codecs() -> Tuple[str, ...]:
+    """Names of the codecs usable in this environment"""
+    names = [ZlibCodec.name]
+    if zstandard is not None:
+        names.append(ZstdCodec.name)
+    if lz4_frame is not None:
+        names.append(Lz4Codec.name)
+    return tuple(names)
+
+
+@dataclass
+class Compression:
+    """Compression settings for outgoing payloads.
+
+    Payloads shorter than `threshold` bytes, or that would not get smaller,
+    are sent as they are. Incoming payloads that would decompress to more
+    than `max_size` bytes are rejected (None disables the limit).
+    """
+    codec: str = ZlibCodec.name
+    threshold: int = 512
+    level: Optional[int] = None
+    dictionary: Optional[bytes] = None
+    max_size: Optional[int] = DEFAULT_MAX_SIZE
+    _codec: Codec = field(init=False, repr=False)
+
+    def __post_init__(self):
+        if self.codec not in CODECS:
+            raise ValueError(f"Unknown compression codec: {self.codec}")
+        self._codec = CODECS[self.codec](level=self.level, dictionary=self.dictionary)
+
+    def compress(self, payload: bytes) -> Tuple[bytes, Optional[str]]:
+        """Compress a payload, returning it with its content encoding (None if left as is)"""
+        if len(payload) < self.threshold:
+            return payload, None
+        compressed = self._codec.compress(payload)
+        if len(compressed) >= len(payload):
+            return payload, None
+        return compressed, self._codec.name
+
+    def decompress(self, payload: bytes) -> bytes:
+        return self._codec.decompress(payload, self.max_size)
+
+
+def content_encoding(user_properties: Dict[str, str], content_type: Optional[str]) -> Optional[str]:
+    """Find the content encoding of a message from its user properties or a `+codec` content-type suffix"""
+    encoding = user_properties.get(CONTENT_ENCODING)
+    if encoding:
+        return encoding
+    if content_type and '+' in content_type:
+        suffix = content_type.rsplit('+', 1)[1].strip()
+        if suffix in CODECS:
+            return suffix
+    return None
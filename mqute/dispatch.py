@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+
+DEFAULT_WEIGHTS = {
+    PRIORITY_HIGH: 8,
+    PRIORITY_NORMAL: 4,
+    PRIORITY_LOW: 1,
+}
+
+
+@dataclass
+class ClassMetrics:
+    """Queue metrics of one priority class"""
+    depth: int = 0
+    max_depth: int = 0
+    enqueued: int = 0
+    dispatched: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.dispatched if self.dispatched else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "dispatched": self.dispatched,
+            "mean_wait": self.mean_wait,
+            "max_wait": self.max_wait,
+        }
+
+
+class PriorityDispatcher:
+    """Dispatches jobs from per-priority queues with smooth weighted round-robin.
+
+    When several classes have work queued, each gets a share of dispatches
+    proportional to its weight. A high-priority job therefore waits for at
+    most a few jobs of other classes, and low-priority classes are never
+    starved completely. Jobs of one class run in arrival order with a single
+    worker; with more workers they may overlap.
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, int]] = None,
+        workers: int = 1,
+        default: str = PRIORITY_NORMAL,
+    ):
+        weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        if not weights or any(weight <= 0 for weight in weights.values()):
+            raise ValueError("Priority weights must be positive")
+        if default not in weights:
+            raise ValueError(f"Unknown default priority class: {default}")
+        self.weights = weights
+        self.default = default
+        self._workers = workers
+        self._queues: Dict[str, Deque[Tuple[float, Callable[[], None]]]] = {name: deque() for name in weights}
+        self._current: Dict[str, int] = {name: 0 for name in weights}
+        self._metrics: Dict[str, ClassMetrics] = {name: ClassMetrics() for name in weights}
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+
+    def validate(self, priority: str) -> str:
+        """Check that a priority class exists, returning it"""
+        if priority not in self.weights:
+            raise ValueError(f"Unknown priority class: {priority}")
+        return priority
+
+    def submit(self, priority: str, job: Callable[[], None]) -> None:
+        """Queue a job in a priority class"""
+        self.validate(priority)
+        with self._condition:
+            self._queues[priority].append((time.monotonic(), job))
+            metrics = self._metrics[priority]
+            metrics.enqueued += 1
+            metrics.depth += 1
+            metrics.max_depth = max(metrics.max_depth, metrics.depth)
+            self._condition.notify()
+
+    def _next(self) -> Optional[Tuple[float, Callable[[], None]]]:
+        """Pick the next job across non-empty classes. Must hold the condition"""
+        ready = [name for name, queue in self._queues.items() if queue]
+        if not ready:
+            return None
+        total = 0
+        for name in ready:
+            self._current[name] += self.weights[name]
+            total += self.weights[name]
+        chosen = max(ready, key=lambda name: self._current[name])
+        self._current[chosen] -= total
+        enqueued_at, job = self._queues[chosen].popleft()
+        wait = time.monotonic() - enqueued_at
+        metrics = self._metrics[chosen]
+        metrics.depth -= 1
+        metrics.dispatched += 1
+        metrics.total_wait += wait
+        metrics.max_wait = max(metrics.max_wait, wait)
+        if not self._queues[chosen]:
+            # An idle class doesn't keep credit for when it comes back
+            self._current[chosen] = 0
+        return enqueued_at, job
+
+    def run_pending(self) -> int:
+        """Run queued jobs in the calling thread until the queues are empty"""
+        count = 0
+        while True:
+            with self._condition:
+                item = self._next()
+            if item is None:
+                return count
+            self._run(item[1])
+            count += 1
+
+    def _run(self, job: Callable[[], None]) -> None:
+        try:
+            job()
+        except Exception as e:
+            print(f"Dispatched job failed: {str(e)}")
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                item = self._next()
+                while item is None and self._running:
+                    self._condition.wait()
+                    item = self._next()
+                if item is None:
+                    return
+            self._run(item[1])
+
+    def start(self) -> None:
+        """Start the worker threads"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._threads = [
+            threading.Thread(target=self._work, name=f"mqute-dispatch-{i}", daemon=True)
+            for i in range(self._workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the workers once the queued jobs are done"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Per-class queue depth and wait time metrics"""
+        with self._condition:
+            return {name: metrics.to_dict() for name, metrics in self._metrics.items()}
@@ -1,38 +1,120 @@
-from typing import Dict, Callable, Any, List
+from concurrent.futures import Executor
+from typing import Dict, Callable, Any, List, Optional, Set, Union
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 import threading
+import time
 
+from .compression import Compression, CONTENT_ENCODING, DEFAULT_MAX_SIZE, content_encoding
 from .credentials import Credential
+from .dispatch import PriorityDispatcher
+from .reconnect import ReconnectManager, ReconnectPolicy
 from .router import Router
 from .request import Request
+from .routes import Route, topic_filter
+from .tracing import Tracer, Span, SpanContext, TRACEPARENT, current_span
 
 class MQuteRequest(Request):
-    def __init__(self, path: str, userdata: Any, payload: Any, resolve: Callable):
-        super().__init__(path, payload, resolve)
+    def __init__(
+        self,
+        path: str,
+        userdata: Any,
+        payload: Any,
+        resolve: Callable,
+        properties: Optional[Dict[str, str]] = None,
+        span: Optional[Span] = None,
+        deadline: Optional[float] = None,
+    ):
+        super().__init__(path, payload, resolve, properties=properties or {}, span=span, deadline=deadline)
         self.userdata = userdata
 
+SUBSCRIBE_QOS = 1
+
 class MQute (Router):
-    def __init__(self, url: str, port: int, credentials: Credential):
+    def __init__(
+        self,
+        url: str,
+        port: int,
+        credentials: Credential,
+        tracer: Optional[Tracer] = None,
+        compression: Optional[Compression] = None,
+        executor: Optional[Executor] = None,
+        dispatcher: Optional[PriorityDispatcher] = None,
+        manual_ack: bool = False,
+        receive_maximum: Optional[int] = None,
+        reconnect: Optional[ReconnectPolicy] = None,
+        session_expiry: Optional[int] = None,
+        deadline_workers: int = 8,
+        keepalive: int = 60,
+    ):
+        """
+        With `manual_ack`, QoS 1/2 messages are acknowledged only once their
+        handlers completed, so nothing acknowledged is lost if the process dies
+        while messages are queued. `receive_maximum` bounds how many such
+        messages can be unacknowledged at once. On MQTT v5 it is advertised to
+        the broker, which stops sending once the window is full. MQTT 3.1.1 has
+        no such flow control, so the window is enforced locally by holding up
+        the network thread; since that also holds up keepalive pings, a message
+        waits for at most half the `keepalive` interval before it is let
+        through anyway (counted as `window_exceeded` in `metrics`).
+
+        `reconnect` sets the backoff used when the connection drops. With
+        `session_expiry` (seconds, MQTT v5 only) the broker keeps the session
+        across reconnects and resubscribing is skipped when it did.
+
+        Sync handlers of messages with a deadline run on `executor`, or else on
+        a pool of `deadline_workers` threads, and are abandoned when it passes.
+        Abandoned handlers still running are reported in `metrics`.
+        """
+        if receive_maximum is not None and not 0 < receive_maximum <= 65535:
+            raise ValueError("receive_maximum must be between 1 and 65535")
+        # Set before routes can be registered, since it validates their priority
+        self.__dispatcher = dispatcher
+        super().__init__(executor=executor, deadline_workers=deadline_workers)
         self.__url = url
         self.__port = port
         self.__credentials = credentials
-        self.__client = self.__create_client()
+        self.__tracer = tracer
+        self.__compression = compression
+        # What compression=True means for an application without compression settings
+        self.__default_compression = Compression()
+        self.__decoders: Dict[str, Compression] = {}
         self.__event_handlers: Dict[str, Callable] = {}
+        self.__subscribed: Set[str] = set()
+        self.__metrics: Dict[str, int] = {
+            'expired': 0, 'timed_out': 0, 'in_flight': 0, 'acked': 0, 'window_exceeded': 0,
+        }
+        self.__metrics_lock = threading.Lock()
+        self.__subscription_lock = threading.Lock()
+        self.__manual_ack = manual_ack
+        self.__receive_maximum = receive_maximum
+        self.__keepalive = keepalive
+        self.__reconnect = reconnect or ReconnectPolicy()
+        self.__session_expiry = session_expiry
+        self.__connection: Optional[ReconnectManager] = None
+        self.__connect_handlers: List[Callable] = []
+        self.__client = self.__create_client()
+        # v5 brokers enforce the advertised Receive Maximum themselves
+        self.__in_flight: Optional[threading.BoundedSemaphore] = None
+        if manual_ack and receive_maximum and self.__client.protocol != mqtt.MQTTv5:
+            self.__in_flight = threading.BoundedSemaphore(receive_maximum)
         
     
     def on_connect(self):
         """
         Decorator for handling MQTT connect events.
         
+        Handlers run on every (re)connect, in registration order, after the
+        routed topics have been subscribed.
+        
         Usage:
             @broker.on_connect()
             def handle_connect(client, userdata, flags, rc):
                 print(f"Connected with result code: {rc}")
         """
         def decorator(handler: Callable) -> Callable:
-            self.__event_handlers['on_connect'] = handler
-            if self.__client:
-                self.__client.on_connect = handler
+            self.__connect_handlers.append(handler)
             return handler
         return decorator
     
@@ -84,18 +166,218 @@ class MQute (Router):
             return handler
         return decorator
     
+    def __on_connect(self, client, userdata, flags, rc, *args):
+        """Bring subscriptions up to date, then run the user's connect handlers in order"""
+        if rc == 0:
+            if self.__connection:
+                self.__connection.connected()
+            if isinstance(flags, dict):
+                session_present = bool(flags.get('session present'))
+            else:
+                session_present = bool(getattr(flags, 'session_present', False))
+            with self.__subscription_lock:
+                topics = {route.topic for route in self.routes}
+                if session_present:
+                    # The broker kept our subscriptions: only replay route changes made while offline
+                    stale = self.__subscribed - topics
+                    fresh = topics - self.__subscribed
+                    if stale:
+                        client.unsubscribe(sorted(stale))
+                else:
+                    fresh = topics
+                if fresh:
+                    client.subscribe([(topic, SUBSCRIBE_QOS) for topic in sorted(fresh)])
+                self.__subscribed = topics
+        for handler in self.__connect_handlers:
+            try:
+                handler(client, userdata, flags, rc, *args)
+            except Exception as e:
+                print(f"on_connect handler failed: {str(e)}")
+
+    def _routes_changed(self, added: List[Route], removed: List[str]) -> None:
+        """Keep broker subscriptions in step with the route table, one change at a time"""
+        if not self.__client.is_connected():
+            # __on_connect subscribes to the whole table
+            return
+        with self.__subscription_lock:
+            table = self.routes
+            stale = {topic_filter(path) for path in removed if table.get(path) is None}
+            fresh = {route.topic for route in added} - self.__subscribed
+            if stale:
+                self.__client.unsubscribe(sorted(stale))
+                self.__subscribed -= stale
+            if fresh:
+                self.__client.subscribe([(topic, SUBSCRIBE_QOS) for topic in sorted(fresh)])
+                self.__subscribed |= fresh
+
     def __on_message(self, client, userdata, message):
-        """Handle incoming MQTT messages and route them to appropriate handlers"""
+        """Handle incoming MQTT messages, queueing them by route priority when a dispatcher is set"""
+        # Resolved once, the same way route() will, so topics like "/a/b" get the settings of route "a/b"
+        route = self._match_route(message.topic)
+        deadline = self.__deadline(message, route, time.monotonic())
+        slot = False
+        if self.__manual_ack and message.qos > 0:
+            if self.__in_flight is not None:
+                # Blocks the network thread, and so reading from the broker, while the window is full,
+                # but not long enough for the broker to miss our keepalive
+                slot = self.__in_flight.acquire(timeout=self.__keepalive / 2)
+                if not slot:
+                    with self.__metrics_lock:
+                        self.__metrics['window_exceeded'] += 1
+            with self.__metrics_lock:
+                self.__metrics['in_flight'] += 1
+        if self.__dispatcher is None:
+            self.__process_message(client, userdata, message, route, deadline, slot)
+            return
+        priority = route.priority if route is not None and route.priority else self.__dispatcher.default
+        self.__dispatcher.submit(priority, lambda: self.__process_message(client, userdata, message, route, deadline, slot))
+
+    def __process_message(
+        self, client, userdata, message, route: Optional[Route], deadline: Optional[float], slot: bool = False,
+    ):
+        """Handle a message, then acknowledge it (and free its window slot) when acks are manual"""
+        try:
+            self.__handle_message(client, userdata, message, route, deadline)
+        finally:
+            if self.__manual_ack and message.qos > 0:
+                client.ack(message.mid, message.qos)
+                with self.__metrics_lock:
+                    self.__metrics['in_flight'] -= 1
+                    self.__metrics['acked'] += 1
+                if slot:
+                    self.__in_flight.release()
+
+    @staticmethod
+    def __deadline(message, route: Optional[Route], received: float) -> Optional[float]:
+        """Deadline of a message from its v5 expiry interval and the route's max age, whichever is sooner"""
+        limits = []
+        expiry = getattr(getattr(message, 'properties', None), 'MessageExpiryInterval', None)
+        if expiry is not None:
+            limits.append(expiry)
+        if route is not None and route.max_age is not None:
+            limits.append(route.max_age)
+        return received + min(limits) if limits else None
+
+    def _handler_timed_out(self, request: Request) -> None:
+        with self.__metrics_lock:
+            self.__metrics['timed_out'] += 1
+
+    def _validate_route(self, route: Route) -> None:
+        if route.priority is not None and self.__dispatcher is not None:
+            self.__dispatcher.validate(route.priority)
+
+    def __handle_message(
+        self, client, userdata, message, route: Optional[Route] = None, deadline: Optional[float] = None,
+    ):
+        """Route an incoming MQTT message to the appropriate handlers"""
+        if deadline is not None and time.monotonic() >= deadline:
+            # Expired while queued: drop it before spending anything on decoding
+            with self.__metrics_lock:
+                self.__metrics['expired'] += 1
+            return
         topic = message.topic
         payload = message.payload
+        properties = self.__user_properties(message)
+        span = None
+        if self.__tracer:
+            parent = SpanContext.from_traceparent(properties.get(TRACEPARENT, ""))
+            span = self.__tracer.start_span(f"receive {topic}", parent=parent)
+            span.set_attribute("topic", topic)
+            span.set_attribute("qos", message.qos)
+
+        def reply(response):
+            route = request.route
+            compression = route.compression if route is not None else None
+            self.__publish(
+                topic,
+                response.to_payload(),
+                qos=1,
+                retain=False,
+                compression=compression,
+                user_properties=response.user_properties(),
+            )
+
         # Try each router in order
         request = MQuteRequest(
             path=topic,
             userdata=userdata,
             payload=payload,
-            resolve=lambda response: client.publish(topic, response.to_string(), qos=1, retain=False),
+            resolve=reply,
+            properties=properties,
+            span=span,
+            deadline=deadline,
         )
-        self.route(request)
+        encoding = content_encoding(properties, getattr(getattr(message, 'properties', None), 'ContentType', None))
+        if encoding:
+            try:
+                request.payload = self.__decoder(route, encoding).decompress(payload)
+            except Exception as e:
+                request.reject(f"Failed to decompress payload: {str(e)}")
+                return
+        if span is None:
+            self.route(request)
+            return
+        with span:
+            self.route(request)
+
+    def __decoder(self, route: Optional[Route], encoding: str) -> Compression:
+        """Pick the compression settings (and so the dictionary) to decode a payload with"""
+        for compression in (route.compression if route else None, self.__compression):
+            if isinstance(compression, Compression) and compression.codec == encoding:
+                return compression
+        decoder = self.__decoders.get(encoding)
+        if decoder is None:
+            max_size = self.__compression.max_size if self.__compression is not None else DEFAULT_MAX_SIZE
+            decoder = self.__decoders[encoding] = Compression(codec=encoding, max_size=max_size)
+        return decoder
+
+    @staticmethod
+    def __user_properties(message) -> Dict[str, str]:
+        """Extract MQTT v5 user properties from a message as a dict"""
+        properties = getattr(message, 'properties', None)
+        return dict(getattr(properties, 'UserProperty', None) or [])
+
+    def __publish_properties(self, user_properties: Dict[str, str]) -> Optional[Properties]:
+        """Build PUBLISH properties, or None when the client is not speaking MQTT v5"""
+        if not user_properties or self.__client.protocol != mqtt.MQTTv5:
+            return None
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.UserProperty = list(user_properties.items())
+        return properties
+
+    def __publish(
+        self,
+        topic: str,
+        payload: Any,
+        qos: int,
+        retain: bool,
+        compression: Union[Compression, bool, None] = None,
+        user_properties: Optional[Dict[str, str]] = None,
+    ):
+        """Publish a message, compressing the payload and injecting the current trace context when enabled"""
+        user_properties = dict(user_properties or {})
+        if compression is None:
+            compression = self.__compression
+        elif compression is True:
+            compression = self.__compression or self.__default_compression
+        # Receivers can only tell a payload is compressed from its v5 user properties
+        if compression and self.__client.protocol == mqtt.MQTTv5:
+            if isinstance(payload, str):
+                payload = payload.encode('utf-8')
+            if isinstance(payload, (bytes, bytearray, memoryview)):
+                payload, encoding = compression.compress(bytes(payload))
+                if encoding:
+                    user_properties[CONTENT_ENCODING] = encoding
+        if not self.__tracer:
+            properties = self.__publish_properties(user_properties)
+            return self.__client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
+        parent = current_span()
+        span = parent.child(f"publish {topic}") if parent else self.__tracer.start_span(f"publish {topic}")
+        with span:
+            span.set_attribute("topic", topic)
+            user_properties[TRACEPARENT] = span.context.to_traceparent()
+            properties = self.__publish_properties(user_properties)
+            return self.__client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
 
     def __create_client(self):
         """Create and configure the MQTT client based on credentials"""
@@ -105,33 +387,103 @@ class MQute (Router):
             print("Here!!!!")
         else:
             client = mqtt.Client()
+        client.manual_ack_set(self.__manual_ack)
         
-        # Set up message handler
+        # Set up message and connect handlers
         client.on_message = self.__on_message
+        client.on_connect = self.__on_connect
         
         # Reattach any existing event handlers
         for event_name, handler in self.__event_handlers.items():
             setattr(client, event_name, handler)
         return client
     
+    def __connect_options(self) -> Dict[str, Any]:
+        """Keyword arguments for each CONNECT, including the v5 session and flow control properties"""
+        if self.__client.protocol != mqtt.MQTTv5:
+            return {}
+        properties = Properties(PacketTypes.CONNECT)
+        if self.__receive_maximum:
+            properties.ReceiveMaximum = self.__receive_maximum
+        if self.__session_expiry:
+            properties.SessionExpiryInterval = self.__session_expiry
+        return {
+            'clean_start': not self.__session_expiry,
+            'properties': properties if self.__receive_maximum or self.__session_expiry else None,
+        }
+
     def connect(self) -> None:
-        """Connect to the MQTT broker"""
+        """Connect to the MQTT broker in the background, reconnecting whenever the connection drops"""
         try:
-            self.__client.connect_async(self.__url, self.__port)
-            thread = threading.Thread(target=self.__client.loop_forever, daemon=True)
-            thread.start()
+            if self.__dispatcher:
+                self.__dispatcher.start()
+            if self.__connection is None:
+                self.__connection = ReconnectManager(
+                    self.__client,
+                    self.__url,
+                    self.__port,
+                    self.__reconnect,
+                    keepalive=self.__keepalive,
+                    connect_options=self.__connect_options,
+                )
+            self.__connection.start()
         except Exception as e:
             raise ConnectionError(f"Failed to connect to MQTT broker: {str(e)}")
     
     def disconnect(self) -> None:
         """Disconnect from the MQTT broker"""
-        self.__client.loop_stop()
-        self.__client.disconnect()
+        if self.__connection:
+            self.__connection.stop()
+        else:
+            self.__client.disconnect()
+        if self.__dispatcher:
+            self.__dispatcher.stop()
+        if self.__tracer:
+            # The tracer outlives the connection, so a later connect() keeps tracing
+            self.__tracer.flush()
     
-    def publish(self, topic: str, payload: Any, qos: int = 0, retain: bool = False) -> None:
-        """Publish a message to a topic"""
-        self.__client.publish(topic, payload, qos=qos, retain=retain)
+    def publish(
+        self,
+        topic: str,
+        payload: Any,
+        qos: int = 0,
+        retain: bool = False,
+        compression: Union[Compression, bool, None] = None,
+        priority: Optional[str] = None,
+    ) -> None:
+        """Publish a message to a topic.
+
+        `compression` overrides the application setting: True uses it (or the
+        default settings when the application has none), False disables it.
+        With a dispatcher, `priority` queues the publish in that priority class
+        instead of sending it right away.
+        """
+        if priority is None or self.__dispatcher is None:
+            self.__publish(topic, payload, qos=qos, retain=retain, compression=compression)
+            return
+        self.__dispatcher.submit(
+            priority,
+            lambda: self.__publish(topic, payload, qos=qos, retain=retain, compression=compression),
+        )
         
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        """Message counters (expired, timed out, in flight, acked), abandoned handlers,
+        plus dispatcher and connection metrics"""
+        with self.__metrics_lock:
+            metrics: Dict[str, Any] = dict(self.__metrics)
+        metrics.update(self.handler_metrics)
+        if self.__dispatcher:
+            metrics['priority'] = self.__dispatcher.metrics()
+        if self.__connection:
+            metrics['connection'] = self.__connection.metrics
+        return metrics
+
+    @property
+    def dispatcher(self) -> Optional[PriorityDispatcher]:
+        """Get the priority dispatcher, if messages are queued by priority"""
+        return self.__dispatcher
+
     @property
     def client(self) -> mqtt.Client:
         """Get the underlying MQTT client instance"""
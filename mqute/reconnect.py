@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+import paho.mqtt.client as mqtt
+
+
+@dataclass
+class ReconnectPolicy:
+    """Exponential backoff with full jitter.
+
+    The n-th consecutive retry waits a random time between 0 and
+    min(maximum, initial * multiplier ** n), so a fleet of clients dropped by
+    the same broker restart spreads its reconnects out instead of arriving
+    all at once.
+    """
+    initial: float = 0.5
+    maximum: float = 60.0
+    multiplier: float = 2.0
+    max_attempts: Optional[int] = None  # consecutive failures before giving up, None retries forever
+
+    def delay(self, attempt: int) -> float:
+        try:
+            ceiling = min(self.maximum, self.initial * self.multiplier ** attempt)
+        except OverflowError:
+            # multiplier ** attempt overflows a float after ~1000 retries, long past the cap
+            ceiling = self.maximum
+        return random.uniform(0, ceiling)
+
+
+class ReconnectManager:
+    """Keeps an MQTT client connected, running its network loop in a background thread"""
+
+    def __init__(
+        self,
+        client: mqtt.Client,
+        host: str,
+        port: int,
+        policy: ReconnectPolicy,
+        keepalive: int = 60,
+        connect_options: Optional[Callable[[], Dict[str, Any]]] = None,
+    ):
+        self._client = client
+        self._host = host
+        self._port = port
+        self._policy = policy
+        self._keepalive = keepalive
+        self._connect_options = connect_options or dict
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._attempt_started: Optional[float] = None
+        self._failures = 0
+        self._metrics: Dict[str, Any] = {
+            'connected': False,
+            'connects': 0,
+            'reconnects': 0,
+            'failed_attempts': 0,
+            'last_connect_latency': None,
+            'max_connect_latency': None,
+        }
+
+    def start(self) -> None:
+        """Start connecting in the background"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="mqute-connection", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Disconnect and stop reconnecting"""
+        self._stopped.set()
+        self._client.disconnect()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def connected(self) -> None:
+        """Record a successful CONNACK. Called from the client's connect callback"""
+        with self._lock:
+            if self._attempt_started is not None:
+                latency = time.monotonic() - self._attempt_started
+                self._metrics['last_connect_latency'] = latency
+                previous = self._metrics['max_connect_latency']
+                self._metrics['max_connect_latency'] = latency if previous is None else max(previous, latency)
+                self._attempt_started = None
+            if self._metrics['connects']:
+                self._metrics['reconnects'] += 1
+            self._metrics['connects'] += 1
+            self._metrics['connected'] = True
+            self._failures = 0
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._metrics)
+
+    def _backoff(self, failed: bool = True) -> bool:
+        """Wait before the next attempt, after a failed one or a dropped connection.
+        Returns False when the manager should give up"""
+        with self._lock:
+            failures = self._failures
+            if failed:
+                self._failures += 1
+        if failed and self._policy.max_attempts is not None and failures + 1 >= self._policy.max_attempts:
+            print(f"Giving up connecting to MQTT broker after {failures + 1} failed attempts")
+            return False
+        return not self._stopped.wait(self._policy.delay(failures))
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            with self._lock:
+                self._attempt_started = time.monotonic()
+            try:
+                self._client.connect(self._host, self._port, self._keepalive, **self._connect_options())
+            except (OSError, ValueError) as e:
+                with self._lock:
+                    self._metrics['failed_attempts'] += 1
+                print(f"Failed to connect to MQTT broker: {str(e)}")
+                if not self._backoff():
+                    return
+                continue
+
+            # Runs the network loop until the connection drops (or a CONNACK refuses us)
+            while not self._stopped.is_set():
+                if self._client.loop(timeout=1.0) != mqtt.MQTT_ERR_SUCCESS:
+                    break
+            with self._lock:
+                # A CONNACK refusing us also ends up here, and counts as a failed attempt
+                failed = not self._metrics['connected']
+                self._metrics['connected'] = False
+            if self._stopped.is_set() or not self._backoff(failed):
+                return
@@ -1,7 +1,37 @@
-from dataclasses import dataclass
-from typing import Any, Callable
+from dataclasses import dataclass, field, replace
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, Union, TYPE_CHECKING
 
-from .response import Response, ErrorResponse
+from .response import Response, ErrorResponse, ARRAY_DTYPE, ARRAY_SHAPE
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+if TYPE_CHECKING:
+    from .routes import Route
+    from .tracing import Span
+
+
+class _PayloadCache:
+    """Decoded forms of a payload, shared by the copies of a request handed to each handler"""
+    __slots__ = ('_values', '_lock')
+
+    def __init__(self):
+        self._values: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, decode: Callable[[], Any]) -> Any:
+        """Get a decoded form, decoding it exactly once even when handlers race for it"""
+        if name in self._values:
+            return self._values[name]
+        with self._lock:
+            if name not in self._values:
+                self._values[name] = decode()
+            return self._values[name]
 
 
 @dataclass
@@ -11,6 +41,15 @@ class Request:
     payload: Any  # No validation, can be any type
     resolve: Callable[[Response], None]
     _resolved: bool = False
+    properties: Dict[str, str] = field(default_factory=dict)  # MQTT v5 user properties
+    span: Optional['Span'] = None
+    params: Dict[str, str] = field(default_factory=dict)  # values of `{name}` segments in the route
+    route: Optional['Route'] = None  # set once the router matched the request
+    deadline: Optional[float] = None  # time.monotonic() after which nobody wants a reply anymore
+    # Shared by the copies handed to each handler of a message, so decoding happens once
+    _cache: _PayloadCache = field(default_factory=_PayloadCache, repr=False)
+    # The message's own reply target when `resolve` was rebound for one handler of a fan-out
+    _reply_to: Optional[Callable[[Response], None]] = field(default=None, repr=False)
 
     def resolve_request(self, response: Response) -> None:
         """Resolve the request with any Response type"""
@@ -29,3 +68,49 @@ class Request:
     @property
     def is_resolved(self) -> bool:
         return self._resolved
+
+    @property
+    def time_remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, or None when the request has none"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def with_payload(self, payload: Any) -> 'Request':
+        """Copy of this unresolved request carrying another payload.
+
+        The copy replies to the message itself, even when this request is a
+        fan-out copy whose replies are funnelled through the route's policy.
+        """
+        return replace(
+            self, payload=payload, resolve=self._reply_to or self.resolve, _resolved=False,
+            _cache=_PayloadCache(), _reply_to=None,
+        )
+
+    def json(self) -> Any:
+        """Decode a JSON payload. The result is cached and shared between handlers, so don't mutate it"""
+        return self._cache.get('json', self._decode_json)
+
+    def _decode_json(self) -> Any:
+        payload = self.payload
+        if isinstance(payload, (bytes, bytearray, memoryview, str)):
+            payload = json.loads(bytes(payload) if isinstance(payload, memoryview) else payload)
+        return payload
+
+    def array(self, dtype: Any = None, shape: Optional[Union[int, Tuple[int, ...]]] = None):
+        """View the payload as a NumPy array without copying it.
+
+        `dtype` and `shape` default to the `dtype`/`shape` user properties
+        sent with an `ArrayResponse`. The returned array is read-only when the
+        payload is immutable bytes.
+        """
+        if np is None:
+            raise ImportError("Request.array requires the 'numpy' package")
+        if dtype is None:
+            dtype = self.properties.get(ARRAY_DTYPE)
+            if dtype is None:
+                raise ValueError("No dtype given and no dtype property on the request")
+        if shape is None and self.properties.get(ARRAY_SHAPE):
+            shape = tuple(int(dim) for dim in self.properties[ARRAY_SHAPE].split(','))
+        array = np.frombuffer(self.payload, dtype=dtype)
+        return array if shape is None else array.reshape(shape)
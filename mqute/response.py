@@ -1,6 +1,14 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+ARRAY_DTYPE = "dtype"
+ARRAY_SHAPE = "shape"
 
 
 @dataclass
@@ -11,6 +19,14 @@ class Response(ABC):
         """Convert response to string format"""
         pass
 
+    def to_payload(self) -> Union[str, bytes]:
+        """Convert response to the payload that gets published"""
+        return self.to_string()
+
+    def user_properties(self) -> Dict[str, str]:
+        """MQTT v5 user properties to publish along with the payload"""
+        return {}
+
 
 @dataclass
 class JsonResponse(Response):
@@ -28,3 +44,30 @@ class ErrorResponse(Response):
 
     def to_string(self) -> str:
         return f"Error: {self.error}"
+
+
+@dataclass
+class ArrayResponse(Response):
+    """NumPy array response, published as the raw array buffer.
+
+    The dtype and shape travel as v5 user properties so that the receiver can
+    rebuild the array with `Request.array()`.
+    """
+    array: Any  # numpy.ndarray
+
+    def __post_init__(self):
+        if np is None:
+            raise ImportError("ArrayResponse requires the 'numpy' package")
+        self.array = np.ascontiguousarray(self.array)
+
+    def to_string(self) -> str:
+        return str(self.array.tolist())
+
+    def to_payload(self) -> bytes:
+        return self.array.tobytes()
+
+    def user_properties(self) -> Dict[str, str]:
+        return {
+            ARRAY_DTYPE: self.array.dtype.str,
+            ARRAY_SHAPE: ','.join(str(dim) for dim in self.array.shape),
+        }
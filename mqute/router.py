@@ -1,14 +1,58 @@
-from typing import Dict, Callable, Any, Optional, List, Union, Tuple, Protocol
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait
+from dataclasses import replace
+from typing import Dict, Callable, Any, Hashable, Iterable, Optional, List, Union, Tuple, Protocol, TYPE_CHECKING
+import asyncio
+import contextvars
+import copy
+import inspect
+import threading
+import time
+
 from .request import Request
+from .response import Response, ErrorResponse
+from .routes import Route, RouteTable, REPLY_PRIMARY, REPLY_FIRST, REPLY_POLICIES
+from .tracing import child_span
+from .window import WindowAggregator, parse_duration
+
+if TYPE_CHECKING:
+    from .compression import Compression
+
+
+DEADLINE_EXCEEDED = "Deadline exceeded"
+
 
+class HandlerTimeout(Exception):
+    """Raised when a handler did not finish before the request deadline"""
+
+
+def _window_value(request: Request) -> float:
+    """Default value of a windowed request: a numeric payload or its `value` field"""
+    payload = request.payload
+    if isinstance(payload, dict):
+        payload = payload["value"]
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode('utf-8')
+    return float(payload)
 
 
 class Router:
-    def __init__(self, prefix: str = ""):
+    def __init__(self, prefix: str = "", executor: Optional[Executor] = None, deadline_workers: int = 8):
         # Remove leading/trailing slashes and normalize
         self.__prefix = prefix.strip('/')
+        # Runs the handlers of a message concurrently when several match it,
+        # and sync handlers of requests with a deadline
+        self.__executor = executor
+        # Without an executor, sync handlers of requests with a deadline run on
+        # a pool of this many threads. A handler still running at the deadline
+        # is abandoned but keeps its thread until it returns
+        self.__deadline_workers = deadline_workers
+        self.__deadline_pool: Optional[ThreadPoolExecutor] = None
+        self.__abandoned = 0
+        self.__pool_lock = threading.Lock()
         self.__middlewares: List[Callable] = []
-        self.__handlers: Dict[str, Callable] = {}
+        self.__table = RouteTable()
+        self.__lock = threading.RLock()
+        self.__listeners: List[Callable[[List[Route], List[str]], None]] = []
     
     @property
     def prefix(self) -> str:
@@ -24,7 +68,8 @@ class Router:
         Middleware should either return (continue) or raise an error (reject)"""
         for middleware in self.__middlewares:
             try:
-                request = middleware(request)
+                with child_span(request.span, f"middleware {getattr(middleware, '__name__', 'middleware')}"):
+                    request = middleware(request)
             except Exception as e:
                 request.reject(str(e))
                 return
@@ -33,40 +78,369 @@ class Router:
         """Normalize a path by removing leading/trailing slashes and empty segments"""
         return '/'.join(segment for segment in path.split('/') if segment)
 
-    def _get_handler(self, path: str) -> Tuple[Optional[Callable], str]:
-        """Get the handler for a path and its full path"""
-        # Normalize the input path
+    def _full_path(self, path: str) -> str:
+        """Normalize a path and put it under this router's prefix"""
         normalized_path = self._normalize_path(path)
-        full_path = self._normalize_path(f"{self.__prefix}/{normalized_path}")
-        print(f"Looking for handler with path: {path}")
-        print(f"Normalized path: {normalized_path}")
-        print(f"Full path with prefix: {full_path}")
-        print(f"Available handlers: {list(self.__handlers.keys())}")
-        handler = self.__handlers.get(full_path)
-        print(f"Found handler: {handler != None}")
-        return self.__handlers.get(full_path)
-
-    def _execute_handler(self, request: Request, handler: Callable) -> None:
-        """Execute a handler for a request"""
+        return self._normalize_path(f"{self.__prefix}/{normalized_path}")
+
+    def _match_route(self, path: str) -> Optional[Route]:
+        """Get the most specific route matching a path, as route() would resolve it"""
+        return self.__table.match(self._full_path(path))
+
+    def _get_routes(self, path: str) -> List[Route]:
+        """Get every route matching a path, most specific first"""
+        return list(self.__table.matches(self._full_path(path)))
+
+    def _execute_handler(self, request: Request, handler: Callable) -> bool:
+        """Execute a handler for a request. Returns whether it was given up on at the request deadline"""
+        if request.deadline is not None and not inspect.iscoroutinefunction(handler):
+            return self._collect([self._submit(request, handler)])
         try:
+            with child_span(request.span, f"handler {getattr(handler, '__name__', 'handler')}"):
+                response = self._call_handler(request, handler)
+                # Handlers returning None don't reply (or already resolved the request themselves)
+                if response is not None and not request.is_resolved:
+                    request.resolve_request(response)
+        except HandlerTimeout:
+            if not request.is_resolved:
+                request.reject(DEADLINE_EXCEEDED)
+            return True
+        except Exception as e:
+            request.reject(str(e))
+        return False
+
+    def _call_handler(self, request: Request, handler: Callable) -> Any:
+        """Call a handler in this thread, cancelling coroutine handlers at the request deadline"""
+        remaining = request.time_remaining
+        if remaining is None:
             response = handler(request)
-            request.resolve_request(response)
+            if inspect.isawaitable(response):
+                response = asyncio.run(response)
+            return response
+        if remaining <= 0:
+            raise HandlerTimeout()
+        try:
+            return asyncio.run(asyncio.wait_for(handler(request), remaining))
+        except asyncio.TimeoutError:
+            raise HandlerTimeout()
+
+    def _handler_pool(self) -> Executor:
+        """The executor if there is one, else this router's bounded deadline pool"""
+        if self.__executor is not None:
+            return self.__executor
+        with self.__pool_lock:
+            if self.__deadline_pool is None:
+                self.__deadline_pool = ThreadPoolExecutor(
+                    max_workers=self.__deadline_workers, thread_name_prefix="mqute-deadline",
+                )
+            return self.__deadline_pool
+
+    def _submit(self, request: Request, handler: Callable) -> Tuple[Request, Optional[Future]]:
+        """Start a sync handler on the handler pool, where it can be abandoned at the request deadline.
+
+        Sync handlers can't be interrupted, so an abandoned one keeps running
+        (and holding its thread) until it returns.
+        """
+        remaining = request.time_remaining
+        if remaining is not None and remaining <= 0:
+            return request, None
+
+        def run() -> Any:
+            with child_span(request.span, f"handler {getattr(handler, '__name__', 'handler')}"):
+                return handler(request)
+
+        context = contextvars.copy_context()
+        return request, self._handler_pool().submit(context.run, run)
+
+    def _collect(self, started: List[Tuple[Request, Optional[Future]]]) -> bool:
+        """Wait for handlers started with `_submit` until the deadline and reply with their responses.
+        Returns whether any of them was given up on"""
+        futures = [future for _, future in started if future is not None]
+        remaining = started[0][0].time_remaining  # All copies of a request share its deadline
+        done, _ = wait(futures, timeout=max(0.0, remaining)) if futures else (set(), set())
+        timed_out = False
+        for request, future in started:
+            if future is not None and future in done:
+                try:
+                    response = future.result()
+                    if inspect.isawaitable(response):
+                        response = asyncio.run(response)
+                    if response is not None and not request.is_resolved:
+                        request.resolve_request(response)
+                except Exception as e:
+                    if not request.is_resolved:
+                        request.reject(str(e))
+                continue
+            timed_out = True
+            if future is not None and not future.cancel():
+                self._abandon(future)
+            if not request.is_resolved:
+                request.reject(DEADLINE_EXCEEDED)
+        return timed_out
+
+    def _abandon(self, future: Future) -> None:
+        """Count a handler left running past its deadline until it returns"""
+        with self.__pool_lock:
+            self.__abandoned += 1
+
+        def returned(_: Future) -> None:
+            with self.__pool_lock:
+                self.__abandoned -= 1
+
+        future.add_done_callback(returned)
+
+    @property
+    def handler_metrics(self) -> Dict[str, Optional[int]]:
+        """Sync handlers still running past their deadline, and the size of the
+        deadline pool (None when handlers run on the configured executor)"""
+        with self.__pool_lock:
+            return {
+                'abandoned': self.__abandoned,
+                'deadline_workers': None if self.__executor is not None else self.__deadline_workers,
+            }
+
+    async def _execute_async_handler(self, request: Request, handler: Callable) -> bool:
+        """Execute a coroutine handler for a request, cancelling it at the request deadline.
+        Returns whether it was cancelled"""
+        try:
+            with child_span(request.span, f"handler {getattr(handler, '__name__', 'handler')}"):
+                remaining = request.time_remaining
+                if remaining is None:
+                    response = await handler(request)
+                elif remaining <= 0:
+                    raise HandlerTimeout()
+                else:
+                    try:
+                        response = await asyncio.wait_for(handler(request), remaining)
+                    except asyncio.TimeoutError:
+                        raise HandlerTimeout()
+                if response is not None and not request.is_resolved:
+                    request.resolve_request(response)
+        except HandlerTimeout:
+            if not request.is_resolved:
+                request.reject(DEADLINE_EXCEEDED)
+            return True
         except Exception as e:
             request.reject(str(e))
+        return False
+
+    def _handler_timed_out(self, request: Request) -> None:
+        """Hook called once per request when any of its handlers was abandoned or cancelled at the deadline"""
+        pass
+
+    def _fan_out(self, request: Request, route: Route, targets: List[Tuple[Route, Callable]]) -> None:
+        """Run every handler matching a request concurrently and reply according to the route's policy.
+
+        Each handler gets its own copy of the request; the copies share the
+        decoded payload cache. Coroutine handlers run together on one event
+        loop while sync handlers run on the executor (or inline without one).
+        """
+        lock = threading.Lock()
+        errors: List[Response] = []
+
+        def reply_first(response: Response) -> None:
+            with lock:
+                if isinstance(response, ErrorResponse):
+                    errors.append(response)
+                elif not request.is_resolved:
+                    request.resolve_request(response)
+
+        def copy_for(target_route: Route, handler: Callable) -> Request:
+            handler_request = copy.copy(request)
+            handler_request._resolved = False
+            handler_request._reply_to = request._reply_to or request.resolve
+            handler_request.params = target_route.params(self._normalize_path(f"{self.__prefix}/{request.path}"))
+            if route.reply == REPLY_PRIMARY and target_route is route and handler is route.handler:
+                handler_request.resolve = request.resolve_request
+            elif route.reply == REPLY_FIRST:
+                handler_request.resolve = reply_first
+            else:
+                handler_request.resolve = lambda response: None
+            return handler_request
+
+        sync_calls = []
+        async_calls = []
+        for target_route, handler in targets:
+            calls = async_calls if inspect.iscoroutinefunction(handler) else sync_calls
+            calls.append((copy_for(target_route, handler), handler))
+
+        futures = []
+        started = []
+        timed_out = False
+        if request.deadline is not None:
+            started = [self._submit(*call) for call in sync_calls]
+        elif self.__executor is not None:
+            futures = [self.__executor.submit(self._execute_handler, *call) for call in sync_calls]
+        else:
+            for call in sync_calls:
+                self._execute_handler(*call)
+        if async_calls:
+            async def gather():
+                return await asyncio.gather(*(self._execute_async_handler(*call) for call in async_calls))
+            timed_out = any(asyncio.run(gather()))
+        wait(futures)
+        if started:
+            timed_out = self._collect(started) or timed_out
+        if timed_out:
+            self._handler_timed_out(request)
+
+        if route.reply == REPLY_FIRST and not request.is_resolved and errors:
+            request.resolve_request(errors[0])
+
+    def sub(
+        self,
+        path: str,
+        compression: Union['Compression', bool, None] = None,
+        primary: bool = False,
+        reply: Optional[str] = None,
+        priority: Optional[str] = None,
+        max_age: Union[str, float, None] = None,
+    ):
+        """Decorator to register a handler for a path.
+
+        Several handlers can be registered for one path, and all of them run
+        for each message. `reply` picks whose response is published: the
+        `primary` handler (by default the first one registered), the
+        `first` successful response, or `none`.
+
+        `compression` overrides the application's compression for replies on
+        this route; pass True to use the application's (or default) settings
+        and False to never compress them. `priority` names the
+        dispatcher priority class messages on this route are queued in, and
+        `max_age` (seconds or a duration like "5s") how long after arrival a
+        message is still worth handling.
+        """
+        if reply is not None and reply not in REPLY_POLICIES:
+            raise ValueError(f"Unknown reply policy: {reply}")
 
-    def sub(self, path: str):
-        """Decorator to register a handler for a path"""
         def decorator(handler: Callable):
-            # Normalize the path
-            print("Registering handler for path:", path)
             normalized_path = self._normalize_path(path)
-            print("Normalized path:", normalized_path)
             full_path = self._normalize_path(f"{self.__prefix}/{normalized_path}")
-            print("Full path with prefix:", full_path)
-            self.__handlers[full_path] = handler
+            with self.__lock:
+                route = self.__table.get(full_path)
+                if route is None:
+                    route = Route(full_path, (handler,))
+                else:
+                    route = replace(route, handlers=route.handlers + (handler,))
+                if primary:
+                    route = replace(route, primary=handler)
+                if compression is not None:
+                    route = replace(route, compression=compression)
+                if reply is not None:
+                    route = replace(route, reply=reply)
+                if priority is not None:
+                    route = replace(route, priority=priority)
+                if max_age is not None:
+                    route = replace(route, max_age=parse_duration(max_age))
+                self._apply(added=[route])
             return handler
         return decorator
 
+    def window(
+        self,
+        path: str,
+        size: Union[str, float],
+        slide: Union[str, float, None] = None,
+        agg: Union[str, Iterable[str]] = ("mean",),
+        key: Optional[Callable[[Request], Hashable]] = None,
+        value: Optional[Callable[[Request], float]] = None,
+        max_keys: int = 10000,
+        idle_timeout: Union[str, float, None] = None,
+        clock: Callable[[], float] = time.time,
+        compression: Union['Compression', bool, None] = None,
+        priority: Optional[str] = None,
+    ):
+        """Decorator to register a handler called with windowed aggregates of a path.
+
+        Values are aggregated per key (the concrete topic by default) and the
+        handler only runs when a window closes, with the request payload set to
+        a dict holding `start`, `end` and the requested aggregates. The request
+        is the last one of the window's key: when a key goes idle its pending
+        windows are emitted once another message arrives, or when `expire(now)`
+        of the aggregator (the `aggregator` attribute of the handler in the
+        route table) is called from a timer.
+
+        Usage:
+            @router.window("sensors/{deviceID}/temp", size="10s", slide="1s", agg=["mean", "max"])
+            def handle_temperature(request):
+                print(request.params["deviceID"], request.payload["mean"])
+        """
+        aggregator = WindowAggregator(
+            size=parse_duration(size),
+            slide=parse_duration(slide) if slide is not None else None,
+            aggregates=[agg] if isinstance(agg, str) else agg,
+            max_keys=max_keys,
+            idle_timeout=parse_duration(idle_timeout) if idle_timeout is not None else None,
+        )
+        key = key or (lambda request: request.path)
+        value = value or _window_value
+
+        def decorator(handler: Callable):
+            def aggregate(request: Request) -> None:
+                for closed in aggregator.add(key(request), value(request), clock(), context=request):
+                    # Windows of other (evicted) keys reply on the topic of their own last message
+                    window_request = closed.context.with_payload(closed.window)
+                    # This wrapper already runs under the deadline, so the handler runs inline
+                    window_request.deadline = None
+                    self._execute_handler(window_request, handler)
+
+            aggregate.__name__ = getattr(handler, '__name__', 'window')
+            aggregate.aggregator = aggregator
+            self.sub(path, compression=compression, priority=priority)(aggregate)
+            return handler
+        return decorator
+
+    def unsub(self, path: str, handler: Optional[Callable] = None) -> None:
+        """Remove one handler registered for a path, or all of them"""
+        normalized_path = self._normalize_path(path)
+        full_path = self._normalize_path(f"{self.__prefix}/{normalized_path}")
+        with self.__lock:
+            route = self.__table.get(full_path)
+            if handler is None or route is None:
+                self._apply(removed=[full_path])
+                return
+            handlers = tuple(h for h in route.handlers if h is not handler)
+            if not handlers:
+                self._apply(removed=[full_path])
+            elif len(handlers) != len(route.handlers):
+                primary = route.primary if route.primary is not handler else None
+                self._apply(added=[replace(route, handlers=handlers, primary=primary)])
+
+    @property
+    def routes(self) -> RouteTable:
+        """The current route table. Tables are immutable, so this is a consistent snapshot"""
+        return self.__table
+
+    def _apply(self, added: Iterable[Route] = (), removed: Iterable[str] = ()) -> None:
+        """Build a new route table from the current one and swap it in atomically.
+
+        Readers never lock: they pick up either the old or the new table.
+        Writers are serialized so that no update is lost.
+        """
+        added, removed = list(added), list(removed)
+        for route in added:
+            self._validate_route(route)
+        with self.__lock:
+            table = self.__table
+            for path in removed:
+                table = table.remove(path)
+            for route in added:
+                table = table.add(route)
+            if table is self.__table:
+                return
+            self.__table = table
+            self._routes_changed(added, removed)
+            for listener in self.__listeners:
+                listener(added, removed)
+
+    def _validate_route(self, route: Route) -> None:
+        """Hook to reject a route, by raising, before it is added to the table"""
+        pass
+
+    def _routes_changed(self, added: List[Route], removed: List[str]) -> None:
+        """Hook called after the route table was swapped, while writers are still serialized"""
+        pass
+
     def route(self, request: Request) -> None:
         """Route a request through middlewares to the appropriate handler"""
         try:
@@ -75,19 +449,33 @@ class Router:
             if request.is_resolved:
                 return
 
-            # Get and execute handler
-            handler = self._get_handler(request.path)
-            if handler is None:
+            # Get and execute handlers
+            routes = self._get_routes(request.path)
+            if not routes:
                 request.reject(f"No handler registered for path: {request.path}")
                 return
 
-            self._execute_handler(request, handler)
+            route = routes[0]
+            request.route = route
+            targets = [(matched, handler) for matched in routes for handler in matched.handlers]
+            if len(targets) > 1 or route.reply != REPLY_PRIMARY:
+                self._fan_out(request, route, targets)
+                return
+            request.params = route.params(self._normalize_path(f"{self.__prefix}/{request.path}"))
+            if self._execute_handler(request, route.handler):
+                self._handler_timed_out(request)
                 
         except Exception as e:
             request.reject(str(e))
 
     def include_router(self, router: 'Router', prefix: Optional[str] = None) -> None:
-        """Include another router, optionally with a prefix"""
+        """Include another router, optionally with a prefix.
+
+        The included router stays live: routes added to or removed from it
+        later are applied to this router as well. Its handlers are merged with
+        any this router already has on the same path, and removing them leaves
+        the others in place.
+        """
         try:
             # Normalize all prefixes
             router_prefix = self._normalize_path(router.prefix)
@@ -96,27 +484,54 @@ class Router:
                 final_prefix = self._normalize_path(f"{prefix}/{router_prefix}")
             else:
                 final_prefix = router_prefix
+            prefix_segments = router_prefix.split('/') if router_prefix else []
 
-            print(f"Including router with prefix: {router_prefix}")
-            print(f"Final prefix: {final_prefix}")
-            print(f"Original handlers: {list(router.__handlers.items())}")
-
-            for path, handler in router.__handlers.items():
+            def rebase(path: str) -> str:
                 # Remove the router's prefix from the path (by segments, not by string length)
                 path_segments = path.split('/')
-                prefix_segments = router_prefix.split('/') if router_prefix else []
-                # Remove prefix segments from the start of path_segments
                 if path_segments[:len(prefix_segments)] == prefix_segments:
-                    path_without_prefix_segments = path_segments[len(prefix_segments):]
-                else:
-                    path_without_prefix_segments = path_segments
-                path_without_prefix = '/'.join(path_without_prefix_segments)
-                new_path = self._normalize_path(f"{final_prefix}/{path_without_prefix}")
-                print(f"Adding handler for path: {new_path}")
-                self.__handlers[new_path] = handler
+                    path_segments = path_segments[len(prefix_segments):]
+                return self._normalize_path(f"{final_prefix}/{'/'.join(path_segments)}")
+
+            # Handlers the included router contributed to each of our paths, so
+            # they can be swapped out without touching anybody else's handlers
+            contributed: Dict[str, Tuple[Callable, ...]] = {}
 
-            print(f"Final handlers: {list(self.__handlers.keys())}")
+            def on_change(added: List[Route], removed: List[str]) -> None:
+                with self.__lock:
+                    merged, dropped = [], []
+                    updated = dict(contributed)
+                    for path in removed:
+                        path = rebase(path)
+                        route = self.__table.get(path)
+                        previous = updated.pop(path, ())
+                        if route is None:
+                            continue
+                        handlers = tuple(h for h in route.handlers if h not in previous)
+                        if not handlers:
+                            dropped.append(path)
+                        else:
+                            primary = route.primary if route.primary in handlers else None
+                            merged.append(replace(route, handlers=handlers, primary=primary))
+                    for child_route in added:
+                        path = rebase(child_route.path)
+                        route = self.__table.get(path)
+                        previous = updated.get(path, ())
+                        own = tuple(h for h in route.handlers if h not in previous) if route is not None else ()
+                        if own:
+                            primary = route.primary if route.primary in own else child_route.primary
+                            route = replace(route, handlers=own + child_route.handlers, primary=primary)
+                        else:
+                            route = replace(child_route, path=path)
+                        updated[path] = child_route.handlers
+                        merged.append(route)
+                    self._apply(added=merged, removed=dropped)
+                    contributed.clear()
+                    contributed.update(updated)
+
+            # Snapshot and subscribe under the child's lock so no change is missed in between
+            with router.__lock:
+                on_change(list(router.__table), [])
+                router.__listeners.append(on_change)
         except Exception as e:
             raise RuntimeError(f"Failed to include router: {str(e)}")
-    
-    
\ No newline at end of file
@@ -0,0 +1,337 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .compression import Compression
+
+SINGLE_LEVEL = '+'
+MULTI_LEVEL = '#'
+
+# Which handler's response is published when several handlers match a message
+REPLY_PRIMARY = "primary"
+REPLY_FIRST = "first"
+REPLY_NONE = "none"
+REPLY_POLICIES = (REPLY_PRIMARY, REPLY_FIRST, REPLY_NONE)
+
+
+def _segment_key(segment: str) -> str:
+    """Trie key for a path segment; `{name}` parameters match like `+`"""
+    if segment.startswith('{') and segment.endswith('}'):
+        return SINGLE_LEVEL
+    return segment
+
+
+def topic_filter(path: str) -> str:
+    """MQTT topic filter for a normalized route path"""
+    return '/'.join(_segment_key(segment) for segment in path.split('/'))
+
+
+@dataclass(frozen=True)
+class Route:
+    """Handlers registered for a normalized path"""
+    path: str
+    handlers: Tuple[Callable, ...]
+    # None inherits the application setting, True uses the application's (or default)
+    # compression even when it has none configured, False disables compression for replies
+    compression: Union['Compression', bool, None] = None
+    primary: Optional[Callable] = None
+    reply: str = REPLY_PRIMARY
+    priority: Optional[str] = None  # dispatcher priority class, None for the default one
+    max_age: Optional[float] = None  # seconds after arrival past which messages are dropped
+
+    @property
+    def handler(self) -> Callable:
+        """The handler whose response is the reply: the designated primary, else the first registered"""
+        return self.primary if self.primary is not None else self.handlers[0]
+
+    @property
+    def topic(self) -> str:
+        """MQTT topic filter to subscribe to for this route"""
+        return topic_filter(self.path)
+
+    def params(self, path: str) -> Dict[str, str]:
+        """Extract `{name}` parameters from a concrete path matched by this route"""
+        params = {}
+        for pattern, value in zip(self.path.split('/'), path.split('/')):
+            if pattern.startswith('{') and pattern.endswith('}'):
+                params[pattern[1:-1]] = value
+        return params
+
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+_EMPTY_SLOTS = (None,) * (1 << _BITS)
+
+
+class _Entry:
+    __slots__ = ('hash', 'key', 'value')
+
+    def __init__(self, hash: int, key: str, value: Any):
+        self.hash = hash
+        self.key = key
+        self.value = value
+
+
+class _Collision:
+    """Entries whose keys have the same full hash"""
+    __slots__ = ('hash', 'entries')
+
+    def __init__(self, hash: int, entries: Tuple[_Entry, ...]):
+        self.hash = hash
+        self.entries = entries
+
+
+def _hash(key: str) -> int:
+    return hash(key) & ((1 << _HASH_BITS) - 1)
+
+
+def _merge(a: Union[_Entry, _Collision], b: _Entry, shift: int) -> tuple:
+    """Slots of a new level holding two items whose hashes differ"""
+    slots = list(_EMPTY_SLOTS)
+    index_a, index_b = (a.hash >> shift) & _MASK, (b.hash >> shift) & _MASK
+    if index_a == index_b:
+        slots[index_a] = _merge(a, b, shift + _BITS)
+    else:
+        slots[index_a], slots[index_b] = a, b
+    return tuple(slots)
+
+
+def _set(slots: tuple, entry: _Entry, shift: int) -> Tuple[tuple, bool]:
+    """Copy of a level with `entry` stored, and whether its key is new"""
+    index = (entry.hash >> shift) & _MASK
+    item = slots[index]
+    added = True
+    if item is None:
+        new = entry
+    elif isinstance(item, _Entry):
+        if item.key == entry.key:
+            new, added = entry, False
+        elif item.hash == entry.hash:
+            new = _Collision(entry.hash, (item, entry))
+        else:
+            new = _merge(item, entry, shift + _BITS)
+    elif isinstance(item, _Collision):
+        if item.hash == entry.hash:
+            others = tuple(e for e in item.entries if e.key != entry.key)
+            new, added = _Collision(item.hash, others + (entry,)), len(others) == len(item.entries)
+        else:
+            new = _merge(item, entry, shift + _BITS)
+    else:
+        new, added = _set(item, entry, shift + _BITS)
+    copied = list(slots)
+    copied[index] = new
+    return tuple(copied), added
+
+
+def _delete(slots: tuple, hash: int, key: str, shift: int) -> Optional[tuple]:
+    """Copy of a level without `key` (the same level if absent, None once empty)"""
+    index = (hash >> shift) & _MASK
+    item = slots[index]
+    if item is None:
+        return slots
+    if isinstance(item, _Entry):
+        if item.key != key:
+            return slots
+        new = None
+    elif isinstance(item, _Collision):
+        others = tuple(e for e in item.entries if e.key != key)
+        if len(others) == len(item.entries):
+            return slots
+        new = others[0] if len(others) == 1 else _Collision(hash, others)
+    else:
+        new = _delete(item, hash, key, shift + _BITS)
+        if new is item:
+            return slots
+    copied = list(slots)
+    copied[index] = new
+    return tuple(copied) if any(slot is not None for slot in copied) else None
+
+
+class _Children:
+    """Persistent hash array mapped trie of a node's children.
+
+    An update copies one 32-slot level per 5 bits of hash it descends, so
+    adding a child to a node with many siblings does not copy the siblings.
+    """
+    __slots__ = ('_slots', '_size')
+
+    def __init__(self, slots: tuple = _EMPTY_SLOTS, size: int = 0):
+        self._slots = slots
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> Optional['_Node']:
+        hash = _hash(key)
+        item, shift = self._slots, 0
+        while True:
+            item = item[(hash >> shift) & _MASK]
+            if item is None:
+                return None
+            if isinstance(item, _Entry):
+                return item.value if item.key == key else None
+            if isinstance(item, _Collision):
+                return next((e.value for e in item.entries if e.key == key), None)
+            shift += _BITS
+
+    def set(self, key: str, node: '_Node') -> '_Children':
+        slots, added = _set(self._slots, _Entry(_hash(key), key, node), 0)
+        return _Children(slots, self._size + 1 if added else self._size)
+
+    def delete(self, key: str) -> '_Children':
+        slots = _delete(self._slots, _hash(key), key, 0)
+        if slots is self._slots:
+            return self
+        return _Children(slots or _EMPTY_SLOTS, self._size - 1)
+
+    def values(self) -> Iterator['_Node']:
+        stack = [self._slots]
+        while stack:
+            for item in stack.pop():
+                if isinstance(item, _Entry):
+                    yield item.value
+                elif isinstance(item, _Collision):
+                    yield from (e.value for e in item.entries)
+                elif item is not None:
+                    stack.append(item)
+
+
+_NO_CHILDREN = _Children()
+
+
+class _Node:
+    """Trie node. Nodes are never mutated once they are part of a table"""
+    __slots__ = ('children', 'route')
+
+    def __init__(self, children: _Children, route: Optional[Route]):
+        self.children = children
+        self.route = route
+
+
+_EMPTY = _Node(_NO_CHILDREN, None)
+
+
+def _assoc(node: _Node, keys: List[str], index: int, route: Route) -> _Node:
+    """Return a copy of `node` with `route` stored under `keys`, sharing untouched subtrees"""
+    if index == len(keys):
+        return _Node(node.children, route)
+    child = _assoc(node.children.get(keys[index]) or _EMPTY, keys, index + 1, route)
+    return _Node(node.children.set(keys[index], child), node.route)
+
+
+def _dissoc(node: _Node, keys: List[str], index: int) -> Optional[_Node]:
+    """Return a copy of `node` without the route under `keys`, pruning empty nodes"""
+    if index == len(keys):
+        new = _Node(node.children, None)
+    else:
+        child = node.children.get(keys[index])
+        if child is None:
+            return node
+        new_child = _dissoc(child, keys, index + 1)
+        if new_child is child:
+            return node
+        if new_child is None:
+            children = node.children.delete(keys[index])
+        else:
+            children = node.children.set(keys[index], new_child)
+        new = _Node(children, node.route)
+    if new.route is None and not new.children:
+        return None
+    return new
+
+
+class RouteTable:
+    """Immutable, versioned route table.
+
+    Every change returns a new table that shares all untouched subtrees with
+    the previous one, so an update only copies the nodes along the changed
+    path, and within each node only a few levels of its children map.
+    Readers can hold on to a table without any locking.
+    """
+    __slots__ = ('_root', '_size', 'version')
+
+    def __init__(self, root: _Node = _EMPTY, size: int = 0, version: int = 0):
+        self._root = root
+        self._size = size
+        self.version = version
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Route]:
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node.route is not None:
+                yield node.route
+            stack.extend(node.children.values())
+
+    @staticmethod
+    def _keys(path: str) -> List[str]:
+        return [_segment_key(segment) for segment in path.split('/')] if path else []
+
+    def _find(self, path: str) -> Optional[_Node]:
+        node = self._root
+        for key in self._keys(path):
+            node = node.children.get(key)
+            if node is None:
+                return None
+        return node
+
+    def get(self, path: str) -> Optional[Route]:
+        """Get the route registered for exactly this (normalized) path"""
+        node = self._find(path)
+        if node is None or node.route is None or node.route.path != path:
+            return None
+        return node.route
+
+    def add(self, route: Route) -> 'RouteTable':
+        """Return a new table with `route` added, replacing any route on the same path.
+
+        Raises ValueError if another route matches the same topics under
+        different parameter names, e.g. `a/{x}` and `a/{y}`.
+        """
+        node = self._find(route.path)
+        existing = node.route if node is not None else None
+        if existing is not None and existing.path != route.path:
+            raise ValueError(f"Route {route.path} conflicts with {existing.path}")
+        size = self._size if existing is not None else self._size + 1
+        root = _assoc(self._root, self._keys(route.path), 0, route)
+        return RouteTable(root, size, self.version + 1)
+
+    def remove(self, path: str) -> 'RouteTable':
+        """Return a new table without the route on `path`"""
+        if self.get(path) is None:
+            return self
+        root = _dissoc(self._root, self._keys(path), 0) or _EMPTY
+        return RouteTable(root, self._size - 1, self.version + 1)
+
+    def matches(self, path: str) -> Iterator[Route]:
+        """Yield every route matching a concrete topic, most specific first"""
+        segments = path.split('/') if path else []
+        stack: List[Tuple[_Node, int]] = [(self._root, 0)]
+        while stack:
+            node, index = stack.pop()
+            if index == len(segments):
+                if node.route is not None:
+                    yield node.route
+                multi = node.children.get(MULTI_LEVEL)
+                if multi is not None and multi.route is not None:
+                    yield multi.route
+                continue
+            # Pushed in reverse so literal segments are explored first
+            multi = node.children.get(MULTI_LEVEL)
+            if multi is not None and multi.route is not None:
+                stack.append((_Node(_NO_CHILDREN, multi.route), len(segments)))
+            single = node.children.get(SINGLE_LEVEL)
+            if single is not None:
+                stack.append((single, index + 1))
+            literal = node.children.get(segments[index])
+            if literal is not None:
+                stack.append((literal, index + 1))
+
+    def match(self, path: str) -> Optional[Route]:
+        """Get the most specific route matching a concrete topic"""
+        return next(self.matches(path), None)
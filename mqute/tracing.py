@@ -0,0 +1,273 @@
+import contextvars
+import json
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+TRACEPARENT = "traceparent"
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("mqute_current_span", default=None)
+
+
+def current_span() -> Optional['Span']:
+    """Get the span active in the current context, if any"""
+    return _current_span.get()
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    """Identifiers propagated between services (W3C traceparent format)"""
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    def to_traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @classmethod
+    def from_traceparent(cls, value: str) -> Optional['SpanContext']:
+        """Parse a traceparent header, returning None if it is malformed"""
+        parts = value.strip().split('-')
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        try:
+            flags = int(parts[3], 16)
+            int(parts[1], 16)
+            int(parts[2], 16)
+        except ValueError:
+            return None
+        return cls(trace_id=parts[1], span_id=parts[2], sampled=bool(flags & 1))
+
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+def _new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+
+@dataclass
+class Span:
+    """A timed unit of work. Unsampled spans are propagated but never exported"""
+    name: str
+    context: SpanContext
+    tracer: 'Tracer' = field(repr=False)
+    parent_id: Optional[str] = None
+    start: float = 0.0
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    _token: Any = field(default=None, repr=False)
+
+    @property
+    def sampled(self) -> bool:
+        return self.context.sampled
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.sampled:
+            self.attributes[key] = value
+
+    def child(self, name: str) -> 'Span':
+        """Start a new span whose parent is this one"""
+        return self.tracer.start_span(name, parent=self.context)
+
+    def finish(self) -> None:
+        if self.end is not None:
+            return
+        self.end = time.time()
+        if self.sampled:
+            self.tracer._record(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "service": self.tracer.service_name,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": None if self.end is None else (self.end - self.start) * 1000.0,
+            "attributes": self.attributes,
+        }
+
+    def __enter__(self) -> 'Span':
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.set_attribute("error", str(exc))
+        _current_span.reset(self._token)
+        self._token = None
+        self.finish()
+
+
+class SpanExporter(ABC):
+    """Abstract base class for span exporters"""
+
+    @abstractmethod
+    def export(self, spans: List[Span]) -> None:
+        """Export finished, sampled spans"""
+        pass
+
+    def shutdown(self) -> None:
+        """Flush and release any resources held by the exporter"""
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Keeps finished spans in a list, mostly useful for tests"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends finished spans to a file as JSON lines"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    """Creates spans with head-based sampling.
+
+    The sampling decision is taken once, when a trace starts, and travels with
+    the trace context so every downstream hop agrees with it.
+
+    Finished spans are queued and exported in batches from a background
+    thread, so handlers never wait on the exporter. Spans finished while
+    `max_queue_size` spans are already waiting are dropped and counted in
+    `dropped`. Exporter errors are reported and the batch is discarded.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        sample_rate: float = 1.0,
+        service_name: str = "mqute",
+        batch_size: int = 512,
+        export_interval: float = 1.0,
+        max_queue_size: int = 8192,
+    ):
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.export_interval = export_interval
+        self.max_queue_size = max_queue_size
+        self.dropped = 0
+        self._queue: Deque[Span] = deque()
+        self._condition = threading.Condition()
+        # Held while exporting, so a flush also waits for the batch in progress
+        self._export_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def start_span(self, name: str, parent: Optional[SpanContext] = None) -> Span:
+        """Start a span, continuing the trace of `parent` when given"""
+        if parent is None:
+            context = SpanContext(
+                trace_id=_new_trace_id(),
+                span_id=_new_span_id(),
+                sampled=random.random() < self.sample_rate,
+            )
+            parent_id = None
+        else:
+            context = SpanContext(trace_id=parent.trace_id, span_id=_new_span_id(), sampled=parent.sampled)
+            parent_id = parent.span_id
+        return Span(
+            name=name,
+            context=context,
+            tracer=self,
+            parent_id=parent_id,
+            start=time.time() if context.sampled else 0.0,
+        )
+
+    def _record(self, span: Span) -> None:
+        """Queue a finished, sampled span for export"""
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._queue) >= self.max_queue_size:
+                self.dropped += 1
+                return
+            self._queue.append(span)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="mqute-span-exporter", daemon=True)
+                self._thread.start()
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify()
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._closed and len(self._queue) < self.batch_size:
+                    # Give the batch some time to fill up
+                    self._condition.wait(self.export_interval)
+                if self._closed and not self._queue:
+                    return
+            self._export(drain=False)
+
+    def _export(self, drain: bool) -> None:
+        """Export one batch of queued spans, or all of them when draining"""
+        with self._export_lock:
+            while True:
+                with self._condition:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    return
+                try:
+                    self.exporter.export(batch)
+                except Exception as e:
+                    print(f"Failed to export {len(batch)} spans: {str(e)}")
+                if not drain:
+                    return
+
+    def flush(self) -> None:
+        """Export every span finished so far, in the calling thread"""
+        self._export(drain=True)
+
+    def shutdown(self) -> None:
+        """Export the queued spans and shut the exporter down. Later spans are dropped"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+        self.exporter.shutdown()
+
+
+def child_span(parent: Optional[Span], name: str):
+    """Context manager for a child span of `parent`, or a no-op without one"""
+    if parent is None:
+        return nullcontext()
+    return parent.child(name)
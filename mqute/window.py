@@ -0,0 +1,215 @@
+import math
+import threading
+from array import array
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+AGGREGATES = ("count", "sum", "mean", "min", "max")
+
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Union[str, int, float]) -> float:
+    """Parse a duration such as "500ms", "10s", "5m" or a number of seconds"""
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        text = value.strip().lower()
+        for unit in sorted(_UNITS, key=len, reverse=True):
+            if text.endswith(unit):
+                seconds = float(text[:-len(unit)]) * _UNITS[unit]
+                break
+        else:
+            seconds = float(text)
+    if seconds <= 0:
+        raise ValueError(f"Duration must be positive: {value}")
+    return seconds
+
+
+class ClosedWindow(NamedTuple):
+    """Aggregates of a window that closed, with the key and context of the value that closed it"""
+    key: Hashable
+    window: Dict[str, Any]
+    context: Any = None
+
+
+class _KeyState:
+    """Running aggregates of one key's open windows.
+
+    Completed panes holding data are kept in arrival order in a fixed-size
+    ring of compact arrays, with a running count and sum over them, and
+    min/max come from monotonic deques, so closing a window is O(1)
+    amortized however many panes it spans.
+    """
+    __slots__ = (
+        'current', 'count', 'total', 'low', 'high',
+        'panes', 'counts', 'sums', 'head', 'length',
+        'window_count', 'window_sum', 'lows', 'highs',
+        'context', 'last_seen',
+    )
+
+    def __init__(self, pane: int, size: int):
+        self.current = pane
+        self.count, self.total, self.low, self.high = 0, 0.0, math.inf, -math.inf
+        self.panes = array('q', bytes(8 * size))
+        self.counts = array('q', bytes(8 * size))
+        self.sums = array('d', bytes(8 * size))
+        self.head, self.length = 0, 0
+        self.window_count, self.window_sum = 0, 0.0
+        self.lows: Deque[Tuple[int, float]] = deque()
+        self.highs: Deque[Tuple[int, float]] = deque()
+        self.context: Any = None
+        self.last_seen = 0.0
+
+
+class WindowAggregator:
+    """Sliding (or tumbling) time windows aggregated incrementally per key.
+
+    Each window of `size` seconds is made of panes of `slide` seconds. Adding
+    a value and closing a window are O(1) amortized and memory per key is
+    bounded by the number of panes. A window closes when a value for the same
+    key arrives past its end; after a long gap at most `max_catchup` of the
+    windows that closed in between are emitted. Keys idle for longer than
+    `idle_timeout`, or beyond `max_keys`, are evicted, emitting the windows
+    they still had open.
+    """
+
+    def __init__(
+        self,
+        size: float,
+        slide: Optional[float] = None,
+        aggregates: Iterable[str] = ("mean",),
+        max_keys: int = 10000,
+        idle_timeout: Optional[float] = None,
+        max_catchup: int = 16,
+    ):
+        slide = size if slide is None else slide
+        panes = size / slide
+        if slide > size or abs(panes - round(panes)) > 1e-9:
+            raise ValueError("Window size must be a multiple of the slide")
+        self.aggregates = tuple(aggregates)
+        unknown = set(self.aggregates) - set(AGGREGATES)
+        if unknown:
+            raise ValueError(f"Unknown aggregates: {', '.join(sorted(unknown))}")
+        if max_catchup < 1:
+            raise ValueError("max_catchup must be at least 1")
+        self.size = size
+        self.slide = slide
+        self.max_keys = max_keys
+        self.max_catchup = max_catchup
+        # By then every window holding the key's last value has ended
+        self.idle_timeout = size if idle_timeout is None else idle_timeout
+        self._panes = int(round(panes))
+        self._states: 'OrderedDict[Hashable, _KeyState]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def add(self, key: Hashable, value: float, now: float, context: Any = None) -> List[ClosedWindow]:
+        """Add a value observed at `now`, returning the windows it closed.
+
+        Windows of other keys evicted to make room, or for being idle, are
+        returned as well. `context` is handed back with the key's windows.
+        Values older than the key's latest one count toward its current pane.
+        """
+        pane = int(now // self.slide)
+        with self._lock:
+            closed: List[ClosedWindow] = []
+            if key in self._states:
+                self._states.move_to_end(key)
+            self._evict(now, key, closed)
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _KeyState(pane, self._panes)
+            elif pane > state.current:
+                self._close(key, state, pane, closed)
+            state.count += 1
+            state.total += value
+            if value < state.low:
+                state.low = value
+            if value > state.high:
+                state.high = value
+            state.context = context
+            state.last_seen = max(state.last_seen, now)
+            return closed
+
+    def expire(self, now: float) -> List[ClosedWindow]:
+        """Evict keys idle at `now`, returning their remaining windows. Call it from a timer
+        to get the last windows of keys that went quiet when no other key is active"""
+        with self._lock:
+            closed: List[ClosedWindow] = []
+            self._evict(now, None, closed)
+            return closed
+
+    def _close(self, key: Hashable, state: _KeyState, pane: int, closed: List[ClosedWindow]) -> None:
+        """Close the windows ending up to pane boundary `pane` and move the key there"""
+        # Later boundaries can't hold data anymore
+        last = min(pane, state.current + self._panes)
+        emitted = 0
+        for end in range(state.current + 1, last + 1):
+            window = self._advance(state, end)
+            if window is None:
+                break
+            closed.append(ClosedWindow(key, window, state.context))
+            emitted += 1
+            if emitted == self.max_catchup:
+                # Expiry only depends on the boundary, so skip straight to the last one
+                if end < last:
+                    self._advance(state, last)
+                break
+        state.current = pane
+
+    def _advance(self, state: _KeyState, end: int) -> Optional[Dict[str, Any]]:
+        """Move the key to pane boundary `end`, returning the aggregates of the window ending there"""
+        start = end - self._panes
+        # Expire first: the panes left and the one completed here all fit in the ring
+        while state.length and state.panes[state.head] < start:
+            state.window_count -= state.counts[state.head]
+            state.window_sum -= state.sums[state.head]
+            state.head = (state.head + 1) % self._panes
+            state.length -= 1
+        if not state.length:
+            state.window_sum = 0.0  # Don't let rounding errors pile up
+        if state.count and state.current < end:
+            slot = (state.head + state.length) % self._panes
+            state.panes[slot] = state.current
+            state.counts[slot] = state.count
+            state.sums[slot] = state.total
+            state.length += 1
+            state.window_count += state.count
+            state.window_sum += state.total
+            while state.lows and state.lows[-1][1] >= state.low:
+                state.lows.pop()
+            state.lows.append((state.current, state.low))
+            while state.highs and state.highs[-1][1] <= state.high:
+                state.highs.pop()
+            state.highs.append((state.current, state.high))
+            state.count, state.total, state.low, state.high = 0, 0.0, math.inf, -math.inf
+        while state.lows and state.lows[0][0] < start:
+            state.lows.popleft()
+        while state.highs and state.highs[0][0] < start:
+            state.highs.popleft()
+        if state.window_count == 0:
+            return None
+        values = {
+            "count": state.window_count,
+            "sum": state.window_sum,
+            "mean": state.window_sum / state.window_count,
+            "min": state.lows[0][1],
+            "max": state.highs[0][1],
+        }
+        window = {"start": start * self.slide, "end": end * self.slide}
+        window.update((name, values[name]) for name in self.aggregates)
+        return window
+
+    def _evict(self, now: float, incoming: Optional[Hashable], closed: List[ClosedWindow]) -> None:
+        """Drop idle keys, least recently seen first, and make room for a new key"""
+        limit = self.max_keys if incoming is None or incoming in self._states else self.max_keys - 1
+        while self._states:
+            key, state = next(iter(self._states.items()))
+            if key != incoming and (now - state.last_seen > self.idle_timeout or len(self._states) > limit):
+                del self._states[key]
+                self._close(key, state, state.current + self._panes, closed)
+            else:
+                break
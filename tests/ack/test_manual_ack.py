@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+from mqute import MQute, Request, JsonResponse, PriorityDispatcher
+
+
+def test_client_is_in_manual_ack_mode(make_app):
+    app, _, _ = make_app(manual_ack=True)
+    assert app.client._manual_ack is True
+    assert MQute("localhost", 1883, None).client._manual_ack is False
+    with pytest.raises(ValueError):
+        MQute("localhost", 1883, None, receive_maximum=0)
+
+
+def test_ack_follows_handler_completion(make_app, make_message, deliver):
+    dispatcher = PriorityDispatcher()
+    app, _, acks = make_app(manual_ack=True, dispatcher=dispatcher)
+    handled = []
+
+    @app.sub("jobs")
+    def handle_job(request: Request):
+        handled.append(request.path)
+        return JsonResponse(data={})
+
+    deliver(app, make_message("jobs", mid=1, qos=1))
+    deliver(app, make_message("jobs", mid=2, qos=0))
+    assert acks == []
+    assert app.metrics["in_flight"] == 1
+
+    dispatcher.run_pending()
+    assert handled == ["jobs", "jobs"]
+    assert acks == [(1, 1)]
+    assert app.metrics["in_flight"] == 0 and app.metrics["acked"] == 1
+
+
+def test_failed_and_expired_messages_are_still_acked(make_app, make_message, deliver):
+    app, _, acks = make_app(manual_ack=True)
+
+    @app.sub("jobs", max_age=0.0001)
+    def handle_job(request: Request):
+        raise Exception("boom")
+
+    @app.sub("other")
+    def handle_other(request: Request):
+        raise Exception("boom")
+
+    deliver(app, make_message("other", mid=3, qos=1))
+    time.sleep(0.01)
+    deliver(app, make_message("jobs", mid=4, qos=1))
+    assert acks == [(3, 1), (4, 1)]
+
+
+def test_in_flight_window_blocks_until_acked_on_v3(make_app, make_message, deliver):
+    dispatcher = PriorityDispatcher()
+    app, _, acks = make_app(v5=False, manual_ack=True, dispatcher=dispatcher, receive_maximum=2)
+
+    @app.sub("jobs")
+    def handle_job(request: Request):
+        return None
+
+    for mid in (1, 2):
+        deliver(app, make_message("jobs", mid=mid, qos=1))
+
+    third = threading.Thread(target=deliver, args=(app, make_message("jobs", mid=3, qos=1)))
+    third.start()
+    third.join(0.1)
+    assert third.is_alive()
+
+    dispatcher.run_pending()
+    third.join(5)
+    assert not third.is_alive()
+    dispatcher.run_pending()
+    assert [mid for mid, _ in acks] == [1, 2, 3]
+
+
+def test_v3_window_never_holds_the_network_thread_past_half_the_keepalive(make_app, make_message, deliver):
+    dispatcher = PriorityDispatcher()
+    app, _, acks = make_app(v5=False, manual_ack=True, dispatcher=dispatcher, receive_maximum=1, keepalive=0.2)
+
+    @app.sub("jobs")
+    def handle_job(request: Request):
+        return None
+
+    deliver(app, make_message("jobs", mid=1, qos=1))
+    started = time.monotonic()
+    deliver(app, make_message("jobs", mid=2, qos=1))
+    assert 0.05 < time.monotonic() - started < 1
+    assert app.metrics["window_exceeded"] == 1 and app.metrics["in_flight"] == 2
+
+    dispatcher.run_pending()
+    assert [mid for mid, _ in acks] == [1, 2]
+    assert app.metrics["in_flight"] == 0
+
+
+def test_v5_leaves_flow_control_to_the_broker(make_app, make_message, deliver):
+    dispatcher = PriorityDispatcher()
+    app, _, acks = make_app(manual_ack=True, dispatcher=dispatcher, receive_maximum=1)
+
+    @app.sub("jobs")
+    def handle_job(request: Request):
+        return None
+
+    started = time.monotonic()
+    for mid in (1, 2, 3):
+        deliver(app, make_message("jobs", mid=mid, qos=1))
+    # The network thread is never held up, so pings and acks keep flowing
+    assert time.monotonic() - started < 0.1
+    assert app.metrics["in_flight"] == 3 and app.metrics["window_exceeded"] == 0
+    assert app._MQute__connect_options()["properties"].ReceiveMaximum == 1
+
+    dispatcher.run_pending()
+    assert [mid for mid, _ in acks] == [1, 2, 3]
@@ -0,0 +1,47 @@
+import pytest
+from mqute import Request, ArrayResponse
+
+np = pytest.importorskip("numpy")
+
+
+def test_request_array_is_a_view_over_the_payload():
+    frame = np.arange(12, dtype="<f4")
+    payload = frame.tobytes()
+    request = Request("sensors/vibration", payload, resolve=lambda response: None)
+
+    array = request.array("<f4", shape=(3, 4))
+    assert array.shape == (3, 4)
+    assert np.array_equal(array.ravel(), frame)
+    assert np.shares_memory(array, np.frombuffer(payload, dtype="<f4"))
+    assert not array.flags.writeable
+
+
+def test_request_array_uses_dtype_and_shape_properties():
+    response = ArrayResponse(np.ones((2, 3), dtype="<i2"))
+    request = Request(
+        "sensors/vibration",
+        response.to_payload(),
+        resolve=lambda response: None,
+        properties=response.user_properties(),
+    )
+    assert response.user_properties() == {"dtype": "<i2", "shape": "2,3"}
+    assert np.array_equal(request.array(), np.ones((2, 3), dtype="<i2"))
+
+
+def test_request_array_requires_a_dtype():
+    request = Request("sensors/vibration", b"\x00" * 8, resolve=lambda response: None)
+    with pytest.raises(ValueError):
+        request.array()
+
+
+def test_array_response_is_published_with_metadata(make_app, make_message, deliver):
+    app, published, _ = make_app()
+
+    @app.sub("sensors/{deviceID}/fft")
+    def handle_fft(request: Request):
+        return ArrayResponse(np.abs(np.fft.rfft(request.array("<f4"))).astype("<f4"))
+
+    deliver(app, make_message("sensors/a/fft", np.sin(np.linspace(0, 8 * np.pi, 64, dtype="<f4")).tobytes()))
+
+    assert published[0].user_properties == {"dtype": "<f4", "shape": "33"}
+    assert np.frombuffer(published[0].payload, dtype="<f4").shape == (33,)
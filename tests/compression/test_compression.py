@@ -0,0 +1,132 @@
+import json
+import zlib
+
+import pytest
+from mqute import MQute, Request, JsonResponse, Compression
+from mqute.compression import CONTENT_ENCODING, content_encoding
+
+TELEMETRY = json.dumps([{"device": f"sensor-{i}", "temperature": 21.5, "humidity": 40} for i in range(50)]).encode()
+
+
+def test_threshold_and_incompressible_payloads_are_left_alone():
+    compression = Compression(threshold=64)
+    assert compression.compress(b"short") == (b"short", None)
+    payload, encoding = compression.compress(TELEMETRY)
+    assert encoding == "zlib" and len(payload) < len(TELEMETRY)
+    assert compression.decompress(payload) == TELEMETRY
+
+    noise = bytes(range(256)) * 2
+    assert Compression(threshold=0, level=9).compress(zlib.compress(noise)) == (zlib.compress(noise), None)
+
+
+def test_dictionary_round_trip():
+    dictionary = b'{"device": "sensor-", "temperature": , "humidity": }'
+    sample = b'{"device": "sensor-7", "temperature": 21.5, "humidity": 40}'
+    with_dict = Compression(threshold=0, dictionary=dictionary)
+    payload, _ = with_dict.compress(sample)
+    assert len(payload) < len(Compression(threshold=0).compress(sample)[0])
+    assert with_dict.decompress(payload) == sample
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        Compression(codec="brotli")
+
+
+def test_content_encoding_marker():
+    assert content_encoding({CONTENT_ENCODING: "zlib"}, None) == "zlib"
+    assert content_encoding({}, "application/json+zlib") == "zlib"
+    assert content_encoding({}, "application/json") is None
+
+
+def test_publish_compresses_above_threshold(make_app):
+    app, published, _ = make_app(compression=Compression(threshold=64))
+    app.publish("telemetry", TELEMETRY)
+    app.publish("telemetry", "tiny")
+    app.publish("telemetry", TELEMETRY, compression=False)
+
+    assert published[0].user_properties == {CONTENT_ENCODING: "zlib"}
+    assert zlib.decompress(published[0].payload) == TELEMETRY
+    assert published[1].user_properties == {}
+    assert published[2].payload == TELEMETRY and published[2].user_properties == {}
+
+
+def test_request_is_decompressed_and_reply_follows_route_setting(make_app, make_message, deliver):
+    app, published, _ = make_app()
+    received = []
+
+    @app.sub("telemetry/{deviceID}", compression=Compression(threshold=0))
+    def handle_telemetry(request: Request):
+        received.append(request.payload)
+        return JsonResponse(data={"devices": json.loads(request.payload)})
+
+    message = make_message("telemetry/a", zlib.compress(TELEMETRY), {CONTENT_ENCODING: "zlib"})
+    deliver(app, message)
+
+    assert received == [TELEMETRY]
+    assert published[0].user_properties == {CONTENT_ENCODING: "zlib"}
+    assert zlib.decompress(published[0].payload).decode() == str({"devices": json.loads(TELEMETRY)})
+
+
+def test_corrupt_payload_is_rejected(make_app, make_message, deliver):
+    app, published, _ = make_app()
+
+    @app.sub("telemetry")
+    def handle_telemetry(request: Request):
+        return JsonResponse(data={})
+
+    deliver(app, make_message("telemetry", b"not zlib", content_type="text/plain+zlib"))
+    assert published[0].payload.startswith("Error: Failed to decompress payload")
+
+
+def test_decompression_is_bounded():
+    bomb = zlib.compress(b"\0" * (4 * 1024 * 1024))
+    assert len(bomb) < 8192
+    compression = Compression(max_size=1024 * 1024)
+    with pytest.raises(ValueError, match="exceeds 1048576 bytes"):
+        compression.decompress(bomb)
+    assert Compression(max_size=4 * 1024 * 1024).decompress(bomb) == b"\0" * (4 * 1024 * 1024)
+    assert Compression(max_size=None).decompress(bomb) == b"\0" * (4 * 1024 * 1024)
+    with pytest.raises(ValueError, match="Truncated"):
+        compression.decompress(zlib.compress(TELEMETRY)[:-8])
+
+
+def test_primed_contexts_are_reused_across_payloads():
+    dictionary = b'{"device": "sensor-", "temperature": , "humidity": }'
+    compression = Compression(threshold=0, dictionary=dictionary)
+    samples = [json.dumps({"device": f"sensor-{i}", "temperature": i}).encode() for i in range(20)]
+    for sample in samples:
+        payload, _ = compression.compress(sample)
+        assert compression.decompress(payload) == sample
+
+
+def test_oversize_request_is_rejected(make_app, make_message, deliver):
+    app, published, _ = make_app(compression=Compression(max_size=1024))
+    received = []
+
+    @app.sub("telemetry")
+    def handle_telemetry(request: Request):
+        received.append(request.payload)
+
+    message = make_message("telemetry", zlib.compress(b"\0" * 65536), {CONTENT_ENCODING: "zlib"})
+    deliver(app, message)
+    assert received == []
+    assert published[0].payload == b"Error: Failed to decompress payload: Decompressed payload exceeds 1024 bytes"
+
+
+def test_compression_true_uses_application_or_default_settings(make_app, make_message, deliver):
+    app, published, _ = make_app()
+    app.publish("telemetry", TELEMETRY, compression=True)
+    assert published[0].user_properties == {CONTENT_ENCODING: "zlib"}
+    assert zlib.decompress(published[0].payload) == TELEMETRY
+
+    @app.sub("telemetry/{deviceID}", compression=True)
+    def handle_telemetry(request: Request):
+        return JsonResponse(data={"devices": json.loads(TELEMETRY)})
+
+    deliver(app, make_message("telemetry/a"))
+    assert published[1].user_properties == {CONTENT_ENCODING: "zlib"}
+
+    app, published, _ = make_app(compression=Compression(threshold=10 ** 6))
+    app.publish("telemetry", TELEMETRY, compression=True)
+    assert published[0].payload == TELEMETRY and published[0].user_properties == {}
@@ -1,5 +1,85 @@
 import os
 import sys
+from typing import Any, Dict, NamedTuple
+
+import paho.mqtt.client as mqtt
+import pytest
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from mqute import MQute  # noqa: E402
+from mqute.credentials import Credential  # noqa: E402
+
+
+class V5Credential(Credential):
+    """Creates MQTT v5 clients, with a fixed client id when given one"""
+
+    def __init__(self, client_id: str = ""):
+        self._client_id = client_id
+
+    def create_client(self) -> mqtt.Client:
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self._client_id, protocol=mqtt.MQTTv5)
+
+
+class Published(NamedTuple):
+    """A message an app published, with its v5 user properties as a dict"""
+    topic: str
+    payload: Any
+    qos: int
+    user_properties: Dict[str, str]
+
+
+@pytest.fixture
+def v5_credential():
+    """Credentials creating MQTT v5 clients with the given client id"""
+    return V5Credential
+
+
+@pytest.fixture
+def make_message():
+    """Build an incoming MQTT message"""
+    def make(topic: str, payload: bytes = b"{}", user_properties=None, content_type=None,
+             expiry=None, qos: int = 0, mid: int = 0) -> mqtt.MQTTMessage:
+        message = mqtt.MQTTMessage(mid=mid, topic=topic.encode())
+        message.payload = payload
+        message.qos = qos
+        if user_properties or content_type or expiry is not None:
+            message.properties = Properties(PacketTypes.PUBLISH)
+            if user_properties:
+                message.properties.UserProperty = list(user_properties.items())
+            if content_type:
+                message.properties.ContentType = content_type
+            if expiry is not None:
+                message.properties.MessageExpiryInterval = expiry
+        return message
+    return make
+
+
+@pytest.fixture
+def make_app(monkeypatch):
+    """Create an app (MQTT v5 unless `v5=False`) that records what it publishes and acks.
+
+    Returns the app, the list of `Published` messages and the list of (mid, qos) acks.
+    """
+    def make(v5: bool = True, **kwargs):
+        app = MQute("localhost", 1883, V5Credential() if v5 else None, **kwargs)
+        published, acks = [], []
+
+        def publish(topic, payload, qos=0, retain=False, properties=None):
+            user_properties = dict(getattr(properties, 'UserProperty', None) or [])
+            published.append(Published(topic, payload, qos, user_properties))
+
+        monkeypatch.setattr(app.client, "publish", publish)
+        monkeypatch.setattr(app.client, "ack", lambda mid, qos: acks.append((mid, qos)))
+        return app, published, acks
+    return make
+
+
+@pytest.fixture
+def deliver():
+    """Hand a message to an app the way its client's network loop does"""
+    def deliver(app: MQute, message: mqtt.MQTTMessage) -> None:
+        app.client.on_message(app.client, None, message)
+    return deliver
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mqute import Router, Request, JsonResponse, ErrorResponse, PriorityDispatcher
+
+
+def test_time_remaining():
+    request = Request("a", {}, resolve=lambda response: None)
+    assert request.time_remaining is None
+    request.deadline = time.monotonic() + 10
+    assert 9 < request.time_remaining <= 10
+
+
+def test_expired_messages_are_dropped_before_middleware(make_app, make_message, deliver):
+    dispatcher = PriorityDispatcher()
+    app, published, _ = make_app(dispatcher=dispatcher)
+    seen = []
+
+    @app.middleware
+    def record(request: Request):
+        seen.append(request.path)
+        return request
+
+    @app.sub("sensors/{deviceID}", max_age="50ms")
+    def handle_sensor(request: Request):
+        return JsonResponse(data={})
+
+    @app.sub("commands/reboot")
+    def handle_reboot(request: Request):
+        return JsonResponse(data={})
+
+    deliver(app, make_message("sensors/a"))
+    deliver(app, make_message("commands/reboot", expiry=0))
+    deliver(app, make_message("commands/reboot", expiry=60))
+    time.sleep(0.1)
+    dispatcher.run_pending()
+
+    assert seen == ["commands/reboot"]
+    assert app.metrics["expired"] == 2
+    assert len(published) == 1
+
+
+def test_slow_sync_handler_is_abandoned_with_timeout_error(make_app, make_message, deliver):
+    app, published, _ = make_app()
+    release = threading.Event()
+
+    @app.sub("jobs", max_age=0.05)
+    def slow_job(request: Request):
+        release.wait(5)
+        return JsonResponse(data={"late": True})
+
+    started = time.monotonic()
+    deliver(app, make_message("jobs"))
+    release.set()
+
+    assert time.monotonic() - started < 1
+    assert [message.payload for message in published] == ["Error: Deadline exceeded"]
+    assert app.metrics["timed_out"] == 1
+
+
+def test_async_handler_is_cancelled_at_deadline():
+    router = Router()
+    cancelled = []
+
+    @router.sub("jobs")
+    async def slow_job(request: Request):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    responses = []
+    request = Request("jobs", {}, resolve=responses.append, deadline=time.monotonic() + 0.05)
+    router.route(request)
+    assert cancelled == [True]
+    assert isinstance(responses[0], ErrorResponse) and responses[0].error == "Deadline exceeded"
+
+
+def test_handlers_within_deadline_reply_normally():
+    router = Router()
+
+    @router.sub("jobs")
+    def quick_job(request: Request):
+        return JsonResponse(data={"remaining": request.time_remaining > 0})
+
+    responses = []
+    router.route(Request("jobs", {}, resolve=responses.append, deadline=time.monotonic() + 5))
+    assert responses[0].data == {"remaining": True}
+
+
+def test_timeouts_are_counted_once_per_message(make_app, make_message, deliver):
+    app, published, _ = make_app()
+    release = threading.Event()
+
+    @app.sub("jobs", max_age=0.05)
+    def slow_job(request: Request):
+        release.wait(5)
+
+    @app.sub("jobs")
+    async def slow_audit(request: Request):
+        await asyncio.sleep(5)
+
+    deliver(app, make_message("jobs"))
+    release.set()
+    assert [message.payload for message in published] == ["Error: Deadline exceeded"]
+    assert app.metrics["timed_out"] == 1
+
+
+def test_deadline_pool_is_bounded_and_abandoned_handlers_are_reported(make_app, make_message, deliver):
+    app, published, _ = make_app(deadline_workers=1)
+    release = threading.Event()
+    calls = []
+
+    @app.sub("jobs", max_age=0.05)
+    def slow_job(request: Request):
+        calls.append(threading.current_thread().name)
+        release.wait(5)
+
+    deliver(app, make_message("jobs"))
+    assert app.metrics["abandoned"] == 1 and app.metrics["deadline_workers"] == 1
+
+    # The only worker is still busy: the next message times out without ever running
+    deliver(app, make_message("jobs"))
+    release.set()
+    time.sleep(0.1)
+    assert len(calls) == 1 and calls[0].startswith("mqute-deadline")
+    assert app.metrics["abandoned"] == 0
+    assert [message.payload for message in published] == ["Error: Deadline exceeded"] * 2
+
+
+def test_sync_handlers_with_deadline_run_on_the_configured_executor():
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="app-executor")
+    router = Router(executor=executor)
+    threads = []
+
+    @router.sub("jobs")
+    def job(request: Request):
+        threads.append(threading.current_thread().name)
+        return JsonResponse(data={})
+
+    @router.sub("jobs")
+    def audit(request: Request):
+        threads.append(threading.current_thread().name)
+
+    responses = []
+    router.route(Request("jobs", {}, resolve=responses.append, deadline=time.monotonic() + 5))
+    assert len(threads) == 2 and all(name.startswith("app-executor") for name in threads)
+    assert isinstance(responses[0], JsonResponse)
+    assert router.handler_metrics == {"abandoned": 0, "deadline_workers": None}
+
+
+def test_route_settings_apply_to_unnormalized_topics(make_app, make_message, deliver):
+    dispatcher = PriorityDispatcher()
+    app, published, _ = make_app(dispatcher=dispatcher)
+
+    @app.sub("sensors/{deviceID}", max_age="50ms")
+    def handle_sensor(request: Request):
+        return JsonResponse(data={})
+
+    deliver(app, make_message("/sensors/a/"))
+    time.sleep(0.1)
+    dispatcher.run_pending()
+
+    assert app.metrics["expired"] == 1
+    assert published == []
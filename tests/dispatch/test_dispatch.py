@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+from mqute import MQute, Request, PriorityDispatcher
+
+
+def test_weighted_round_robin_shares():
+    dispatcher = PriorityDispatcher(weights={"high": 3, "low": 1}, default="low")
+    order = []
+    for i in range(8):
+        dispatcher.submit("low", lambda i=i: order.append(f"low{i}"))
+    for i in range(6):
+        dispatcher.submit("high", lambda i=i: order.append(f"high{i}"))
+
+    assert dispatcher.run_pending() == 14
+    # High gets three of every four dispatches while both classes are busy
+    assert [name[:-1] for name in order[:8]] == ["high", "high", "low", "high"] * 2
+    # Low is never starved and keeps its arrival order
+    assert [name for name in order if name.startswith("low")] == [f"low{i}" for i in range(8)]
+
+
+def test_metrics_track_depth_and_wait():
+    dispatcher = PriorityDispatcher()
+    dispatcher.submit("low", lambda: None)
+    dispatcher.submit("low", lambda: None)
+    assert dispatcher.metrics()["low"]["depth"] == 2
+
+    dispatcher.run_pending()
+    metrics = dispatcher.metrics()["low"]
+    assert metrics["depth"] == 0
+    assert metrics["max_depth"] == 2
+    assert metrics["dispatched"] == 2
+    assert metrics["max_wait"] >= metrics["mean_wait"] >= 0
+
+
+def test_unknown_priorities_are_rejected():
+    with pytest.raises(ValueError):
+        PriorityDispatcher(weights={"high": 0})
+    with pytest.raises(ValueError):
+        PriorityDispatcher().submit("urgent", lambda: None)
+
+    app = MQute("localhost", 1883, None, dispatcher=PriorityDispatcher())
+    with pytest.raises(ValueError):
+        app.sub("commands/reboot", priority="urgent")(lambda request: None)
+    assert len(app.routes) == 0
+
+
+def test_control_messages_overtake_telemetry_backlog(make_app, make_message, deliver):
+    dispatcher = PriorityDispatcher()
+    app, _, _ = make_app(dispatcher=dispatcher)
+    handled = []
+
+    @app.sub("sensors/{deviceID}", priority="low")
+    def handle_telemetry(request: Request):
+        handled.append("telemetry")
+
+    @app.sub("commands/reboot", priority="high")
+    def handle_reboot(request: Request):
+        handled.append("command")
+
+    for i in range(100):
+        deliver(app, make_message(f"sensors/{i}"))
+    deliver(app, make_message("commands/reboot"))
+
+    dispatcher.run_pending()
+    assert handled.index("command") == 0
+    assert handled.count("telemetry") == 100
+
+
+def test_worker_threads_drain_queue_on_stop():
+    dispatcher = PriorityDispatcher(workers=2)
+    done = []
+    lock = threading.Lock()
+    dispatcher.start()
+    for i in range(50):
+        dispatcher.submit("normal", lambda i=i: (lock.acquire(), done.append(i), lock.release()))
+    dispatcher.stop(timeout=5)
+    assert sorted(done) == list(range(50))
@@ -0,0 +1,187 @@
+"""A tiny in-process MQTT broker stand-in that can be killed and restarted.
+
+It speaks just enough MQTT 3.1.1/5.0 for connection tests: CONNECT, SUBSCRIBE,
+UNSUBSCRIBE, PINGREQ and DISCONNECT, and remembers sessions of clients that
+connect with clean start off and a session expiry.
+"""
+import socket
+import struct
+import threading
+from typing import Dict, List, Set, Tuple
+
+
+def _read_exact(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("closed")
+        data += chunk
+    return data
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value % 128
+        value //= 128
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+
+def _read_str(data: bytes, pos: int) -> Tuple[str, int]:
+    (length,) = struct.unpack_from("!H", data, pos)
+    return data[pos + 2:pos + 2 + length].decode(), pos + 2 + length
+
+
+def _packet(first_byte: int, body: bytes) -> bytes:
+    return bytes([first_byte]) + _encode_varint(len(body)) + body
+
+
+class FakeBroker:
+    def __init__(self, port: int = 0):
+        self.port = port
+        self.sessions: Dict[str, Set[str]] = {}
+        self.connects: List[Dict] = []
+        self.subscribe_packets: List[List[str]] = []
+        self._server = None
+        self._clients: List[socket.socket] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("127.0.0.1", self.port))
+        server.listen()
+        self.port = server.getsockname()[1]
+        self._server = server
+        threading.Thread(target=self._accept, args=(server,), daemon=True).start()
+
+    def kill(self) -> None:
+        """Drop every connection and stop listening, like a crashed broker"""
+        server, self._server = self._server, None
+        if server is not None:
+            # Wakes up the thread blocked in accept(); close() alone doesn't on Linux
+            try:
+                server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            server.close()
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+
+    def _accept(self, server: socket.socket) -> None:
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._clients.append(client)
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, sock: socket.socket) -> None:
+        session = None
+        version = 4
+        try:
+            while True:
+                header = _read_exact(sock, 1)[0]
+                length, shift = 0, 0
+                while True:
+                    byte = _read_exact(sock, 1)[0]
+                    length |= (byte & 0x7F) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = _read_exact(sock, length)
+                kind = header >> 4
+                if kind == 1:
+                    session, version = self._connect(sock, body)
+                elif kind == 8:
+                    packet_id, topics = self._topics(body, version, with_options=True)
+                    session.update(topics)
+                    self.subscribe_packets.append(topics)
+                    props = b"\x00" if version == 5 else b""
+                    sock.sendall(_packet(0x90, struct.pack("!H", packet_id) + props + bytes([1] * len(topics))))
+                elif kind == 10:
+                    packet_id, topics = self._topics(body, version, with_options=False)
+                    session.difference_update(topics)
+                    props = b"\x00" if version == 5 else b""
+                    codes = bytes(len(topics)) if version == 5 else b""
+                    sock.sendall(_packet(0xB0, struct.pack("!H", packet_id) + props + codes))
+                elif kind == 12:
+                    sock.sendall(b"\xd0\x00")
+                elif kind == 14:
+                    return
+        except (ConnectionError, OSError):
+            return
+        finally:
+            sock.close()
+
+    def _connect(self, sock: socket.socket, body: bytes):
+        _, pos = _read_str(body, 0)
+        version = body[pos]
+        flags = body[pos + 1]
+        pos += 4  # level, flags, keepalive
+        expiry = 0
+        if version == 5:
+            props_length, pos = _read_varint(body, pos)
+            end = pos + props_length
+            while pos < end:
+                prop = body[pos]
+                pos += 1
+                if prop == 0x11:
+                    (expiry,) = struct.unpack_from("!I", body, pos)
+                    pos += 4
+                elif prop == 0x21:
+                    pos += 2
+                else:
+                    break
+            pos = end
+        client_id, pos = _read_str(body, pos)
+        clean = bool(flags & 0x02)
+        keep = not clean and (expiry > 0 or version != 5)
+        present = keep and client_id in self.sessions
+        if not present:
+            self.sessions[client_id] = set()
+        session = self.sessions[client_id]
+        if not keep:
+            # Nothing survives this connection
+            self.sessions.pop(client_id)
+        self.connects.append({"client_id": client_id, "clean": clean, "expiry": expiry, "present": present})
+        ack = bytes([1 if present else 0, 0]) + (b"\x00" if version == 5 else b"")
+        sock.sendall(_packet(0x20, ack))
+        return session, version
+
+    @staticmethod
+    def _topics(body: bytes, version: int, with_options: bool):
+        (packet_id,) = struct.unpack_from("!H", body, 0)
+        pos = 2
+        if version == 5:
+            props_length, pos = _read_varint(body, pos)
+            pos += props_length
+        topics = []
+        while pos < len(body):
+            topic, pos = _read_str(body, pos)
+            if with_options:
+                pos += 1
+            topics.append(topic)
+        return packet_id, topics
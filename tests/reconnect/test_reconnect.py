@@ -0,0 +1,134 @@
+import time
+
+import pytest
+from mqute import MQute, Request, ReconnectPolicy
+
+from .broker import FakeBroker
+
+FAST = ReconnectPolicy(initial=0.05, maximum=0.2)
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+def connection(app: MQute) -> dict:
+    return app.metrics.get("connection", {})
+
+
+@pytest.fixture
+def broker():
+    broker = FakeBroker()
+    broker.start()
+    yield broker
+    broker.kill()
+
+
+def test_full_jitter_stays_within_cap():
+    policy = ReconnectPolicy(initial=1.0, maximum=8.0)
+    delays = [policy.delay(attempt) for attempt in range(10) for _ in range(50)]
+    assert all(0 <= delay <= 8.0 for delay in delays)
+    assert max(policy.delay(0) for _ in range(50)) <= 1.0
+    # Jitter spreads retries out instead of every client waiting the cap
+    assert len({round(delay, 3) for delay in delays}) > 100
+
+
+def test_delay_after_many_attempts_stays_at_cap():
+    policy = ReconnectPolicy(initial=0.5, maximum=60.0)
+    for attempt in (1023, 1024, 10_000, 10 ** 9):
+        assert 0 <= policy.delay(attempt) <= 60.0
+
+
+def test_persistent_session_skips_resubscribe(broker, v5_credential):
+    app = MQute("127.0.0.1", broker.port, v5_credential("edge-1"), reconnect=FAST, session_expiry=300)
+    hooks = []
+
+    @app.sub("sensors/{deviceID}/temp")
+    def handle_temperature(request: Request):
+        return None
+
+    @app.on_connect()
+    def first_hook(client, userdata, flags, rc, properties=None):
+        hooks.append("first")
+
+    @app.on_connect()
+    def second_hook(client, userdata, flags, rc, properties=None):
+        hooks.append("second")
+
+    app.connect()
+    try:
+        wait_for(lambda: connection(app).get("connected"))
+        wait_for(lambda: broker.subscribe_packets == [["sensors/+/temp"]])
+        assert broker.connects[0] == {"client_id": "edge-1", "clean": False, "expiry": 300, "present": False}
+
+        broker.kill()
+        wait_for(lambda: not connection(app).get("connected"))
+        app.sub("commands/reboot")(handle_temperature)
+        broker.start()
+
+        wait_for(lambda: connection(app).get("reconnects") == 1)
+        wait_for(lambda: len(broker.subscribe_packets) == 2)
+        assert broker.connects[-1]["present"] is True
+        # Only the route added while offline is subscribed again
+        assert broker.subscribe_packets[1] == ["commands/reboot"]
+        assert hooks == ["first", "second", "first", "second"]
+        assert connection(app)["last_connect_latency"] is not None
+    finally:
+        app.disconnect()
+
+
+def test_clean_session_resubscribes_after_broker_restart(broker):
+    app = MQute("127.0.0.1", broker.port, None, reconnect=FAST)
+
+    @app.sub("sensors/{deviceID}/temp")
+    def handle_temperature(request: Request):
+        return None
+
+    app.connect()
+    try:
+        wait_for(lambda: len(broker.subscribe_packets) == 1)
+        broker.kill()
+        time.sleep(0.1)
+        broker.start()
+        wait_for(lambda: len(broker.subscribe_packets) == 2)
+        assert broker.subscribe_packets[1] == ["sensors/+/temp"]
+        assert connection(app)["reconnects"] == 1
+    finally:
+        app.disconnect()
+
+
+def test_backoff_while_broker_is_down():
+    broker = FakeBroker()
+    broker.start()
+    port = broker.port
+    broker.kill()
+
+    app = MQute("127.0.0.1", port, None, reconnect=FAST)
+    app.connect()
+    try:
+        wait_for(lambda: connection(app).get("failed_attempts", 0) >= 3)
+        assert not connection(app)["connected"]
+        broker.start()
+        wait_for(lambda: connection(app).get("connected"))
+        assert connection(app)["reconnects"] == 0
+    finally:
+        app.disconnect()
+        broker.kill()
+
+
+def test_gives_up_after_max_attempts():
+    broker = FakeBroker()
+    broker.start()
+    port = broker.port
+    broker.kill()
+
+    app = MQute("127.0.0.1", port, None, reconnect=ReconnectPolicy(initial=0.01, maximum=0.02, max_attempts=2))
+    app.connect()
+    wait_for(lambda: connection(app).get("failed_attempts") == 2)
+    time.sleep(0.1)
+    assert connection(app)["failed_attempts"] == 2
+    app.disconnect()
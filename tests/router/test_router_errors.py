@@ -37,7 +37,7 @@ def test_router_inclusion_errors():
         router.include_router(None)
     assert "Failed to include router" in str(exc_info.value)
 
-    # Test including router with same paths (should work, last one wins)
+    # Test including router with same paths (should work, both handlers run)
     sub_router1 = Router()
     sub_router2 = Router()
     
@@ -52,7 +52,7 @@ def test_router_inclusion_errors():
     router.include_router(sub_router1)
     router.include_router(sub_router2)  # This should work, not raise an error
     
-    # Verify that the second handler takes precedence
+    # Verify that the first registered handler replies
     responses = []
     def handle_response(response: Response):
         responses.append(response)
@@ -61,7 +61,8 @@ def test_router_inclusion_errors():
     router.route(request)
     assert len(responses) == 1
     assert isinstance(responses[0], JsonResponse)
-    assert responses[0].data["handler"] == "second"
+    assert responses[0].data["handler"] == "first"
+    assert router.routes.get("test/path").handlers == (handler1, handler2)
 
 def test_router_with_validation_middlewares():
     router = Router()
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from mqute import Router, Request, Response, JsonResponse, ErrorResponse
+
+
+def test_second_handler_does_not_overwrite_first():
+    router = Router()
+    calls = []
+
+    @router.sub("devices/status")
+    def handle_status(request: Request):
+        calls.append("business")
+        return JsonResponse(data={"handler": "business"})
+
+    @router.sub("devices/status")
+    def metrics_tap(request: Request):
+        calls.append("metrics")
+
+    responses = []
+    router.route(Request("devices/status", {}, resolve=responses.append))
+    assert sorted(calls) == ["business", "metrics"]
+    # Adding a tap keeps the first registered handler as the one that replies
+    assert len(responses) == 1 and responses[0].data == {"handler": "business"}
+
+
+def test_designated_primary_replies_and_wildcards_also_run():
+    router = Router()
+    seen = []
+
+    @router.sub("devices/{deviceID}/status")
+    def audit(request: Request):
+        seen.append(("audit", request.params))
+        return JsonResponse(data={"handler": "audit"})
+
+    @router.sub("devices/camera/status", primary=True)
+    def handle_camera(request: Request):
+        seen.append(("camera", request.params))
+        return JsonResponse(data={"handler": "camera"})
+
+    @router.sub("devices/camera/status")
+    def tap(request: Request):
+        seen.append(("tap", request.params))
+        return JsonResponse(data={"handler": "tap"})
+
+    responses = []
+    router.route(Request("devices/camera/status", {}, resolve=responses.append))
+    assert sorted(seen, key=lambda item: item[0]) == [
+        ("audit", {"deviceID": "camera"}), ("camera", {}), ("tap", {}),
+    ]
+    assert len(responses) == 1 and responses[0].data == {"handler": "camera"}
+
+
+def test_first_reply_policy_skips_errors():
+    router = Router()
+
+    @router.sub("jobs", reply="first")
+    def failing(request: Request):
+        raise Exception("boom")
+
+    @router.sub("jobs")
+    def working(request: Request):
+        return JsonResponse(data={"ok": True})
+
+    responses = []
+    router.route(Request("jobs", {}, resolve=responses.append))
+    assert len(responses) == 1 and isinstance(responses[0], JsonResponse)
+
+    router.unsub("jobs", working)
+    responses.clear()
+    router.route(Request("jobs", {}, resolve=responses.append))
+    assert len(responses) == 1 and isinstance(responses[0], ErrorResponse)
+
+
+def test_none_reply_policy():
+    router = Router()
+
+    @router.sub("events", reply="none")
+    def handle_event(request: Request):
+        return JsonResponse(data={})
+
+    responses = []
+    router.route(Request("events", {}, resolve=responses.append))
+    assert responses == []
+
+    with pytest.raises(ValueError):
+        router.sub("events", reply="all")
+
+
+def test_handlers_run_concurrently_on_executor_and_share_decoded_payload(monkeypatch):
+    loads = json.loads
+    decodes = []
+
+    def counting_loads(*args, **kwargs):
+        decodes.append(args)
+        time.sleep(0.01)  # Widen the window in which handlers race for the cache
+        return loads(*args, **kwargs)
+
+    monkeypatch.setattr(json, "loads", counting_loads)
+    barrier = threading.Barrier(4, timeout=5)
+    decoded = []
+    router = Router(executor=ThreadPoolExecutor(max_workers=4))
+
+    def tap(request: Request):
+        barrier.wait()
+        decoded.append(request.json())
+
+    for _ in range(3):
+        router.sub("telemetry")(tap)
+
+    @router.sub("telemetry", primary=True)
+    def handle(request: Request):
+        barrier.wait()
+        decoded.append(request.json())
+        return JsonResponse(data=request.json())
+
+    responses = []
+    router.route(Request("telemetry", b'{"temperature": 21}', resolve=responses.append))
+    assert responses[0].data == {"temperature": 21}
+    assert len(decodes) == 1
+    assert len(decoded) == 4 and all(value is decoded[0] for value in decoded)
+
+
+def test_async_handlers_are_gathered():
+    router = Router()
+    started = []
+    overlapped = []
+
+    @router.sub("telemetry")
+    async def first(request: Request):
+        started.append("first")
+        await asyncio.sleep(0.01)
+        overlapped.append("second" in started)
+        return JsonResponse(data={"handler": "first"})
+
+    @router.sub("telemetry", primary=True)
+    async def second(request: Request):
+        started.append("second")
+        await asyncio.sleep(0.01)
+        return JsonResponse(data={"handler": "second"})
+
+    responses = []
+    router.route(Request("telemetry", {}, resolve=responses.append))
+    assert [response.data for response in responses] == [{"handler": "second"}]
+    assert overlapped == [True]
+
+
+def test_included_router_merges_with_existing_handlers():
+    parent = Router()
+    child = Router()
+    calls = []
+
+    @parent.sub("devices/status")
+    def handle_status(request: Request):
+        calls.append("parent")
+        return JsonResponse(data={"handler": "parent"})
+
+    @child.sub("devices/status")
+    def audit(request: Request):
+        calls.append("child")
+
+    parent.include_router(child)
+    responses = []
+    parent.route(Request("devices/status", {}, resolve=responses.append))
+    assert sorted(calls) == ["child", "parent"]
+    assert responses[0].data == {"handler": "parent"}
+
+    # Later changes of the child only swap its own handlers
+    @child.sub("devices/status")
+    def audit_again(request: Request):
+        calls.append("child again")
+
+    assert parent.routes.get("devices/status").handlers == (handle_status, audit, audit_again)
+    child.unsub("devices/status")
+    assert parent.routes.get("devices/status").handlers == (handle_status,)
+    calls.clear()
+    parent.route(Request("devices/status", {}, resolve=responses.append))
+    assert calls == ["parent"]
@@ -0,0 +1,146 @@
+import time
+
+import pytest
+
+from mqute import MQute, Router, Request, Response, JsonResponse
+from mqute.routes import Route, RouteTable
+
+
+def handler(request: Request):
+    return JsonResponse(data={"path": request.path, "params": request.params})
+
+
+def test_route_table_is_immutable_and_versioned():
+    empty = RouteTable()
+    table = empty.add(Route("devices/a/status", (handler,)))
+    assert len(empty) == 0 and empty.version == 0
+    assert len(table) == 1 and table.version == 1
+
+    removed = table.remove("devices/a/status")
+    assert table.get("devices/a/status") is not None
+    assert removed.get("devices/a/status") is None
+    assert removed.version == 2
+    assert table.remove("missing/path") is table
+
+
+def test_route_table_shares_untouched_subtrees():
+    table = RouteTable()
+    for i in range(1000):
+        table = table.add(Route(f"site{i % 10}/device{i}/status", (handler,)))
+    updated = table.add(Route("site0/device-new/status", (handler,)))
+
+    assert len(updated) == 1001
+    for site in range(1, 10):
+        assert updated._root.children.get(f"site{site}") is table._root.children.get(f"site{site}")
+
+
+def test_route_updates_scale_with_many_siblings():
+    router = Router()
+    started = time.perf_counter()
+    for i in range(50000):
+        router.sub(f"devices/device{i}/status")(handler)
+    elapsed = time.perf_counter() - started
+
+    table = router.routes
+    assert len(table) == 50000
+    assert table.match("devices/device49999/status").path == "devices/device49999/status"
+    # Copying every sibling on each update took tens of seconds here
+    assert elapsed < 15
+
+    devices = table._root.children.get("devices").children
+    updated = table.add(Route("devices/device-new/status", (handler,)))
+    new_devices = updated._root.children.get("devices").children
+
+    def levels(children):
+        stack, found = [children._slots], set()
+        while stack:
+            slots = stack.pop()
+            found.add(id(slots))
+            stack.extend(item for item in slots if isinstance(item, tuple))
+        return found
+
+    # Only the levels along the new key's hash path are copied, at most one per 5 hash bits
+    assert len(levels(new_devices) - levels(devices)) <= 13
+    for i in range(0, 50000, 997):
+        assert new_devices.get(f"device{i}") is devices.get(f"device{i}")
+
+    removed = updated.remove("devices/device-new/status").remove("devices/device0/status")
+    assert len(removed) == 49999
+    assert removed.get("devices/device0/status") is None
+    assert removed.get("devices/device1/status") is not None
+
+
+def test_wildcards_and_params_prefer_specific_routes():
+    table = RouteTable()
+    for path in ["devices/{deviceID}/status", "devices/camera/status", "devices/#"]:
+        table = table.add(Route(path, (handler,)))
+
+    assert [route.path for route in table.matches("devices/camera/status")] == [
+        "devices/camera/status", "devices/{deviceID}/status", "devices/#",
+    ]
+    assert table.match("devices/lamp/status").params("devices/lamp/status") == {"deviceID": "lamp"}
+    assert table.match("devices/lamp/config").path == "devices/#"
+    assert table.match("other/topic") is None
+
+
+def test_included_router_stays_live():
+    parent = Router()
+    child = Router(prefix="/devices")
+    parent.include_router(child, prefix="/home")
+
+    responses = []
+    request = Request("home/devices/lamp", {}, resolve=responses.append)
+    parent.route(request)
+    assert "No handler registered" in responses[0].error
+
+    @child.sub("/{deviceID}")
+    def handle_device(request: Request):
+        return JsonResponse(data=request.params)
+
+    responses.clear()
+    parent.route(Request("home/devices/lamp", {}, resolve=responses.append))
+    assert isinstance(responses[0], JsonResponse)
+    assert responses[0].data == {"deviceID": "lamp"}
+
+    child.unsub("/{deviceID}")
+    responses.clear()
+    parent.route(Request("home/devices/lamp", {}, resolve=responses.append))
+    assert "No handler registered" in responses[0].error
+
+
+def test_broker_subscriptions_follow_route_changes():
+    app = MQute("localhost", 1883, None)
+    calls = []
+    app.client.is_connected = lambda: True
+    app.client.subscribe = lambda topics: calls.append(("subscribe", topics))
+    app.client.unsubscribe = lambda topics: calls.append(("unsubscribe", topics))
+
+    app.sub("sensors/{deviceID}/temp")(handler)
+    app.sub("sensors/{deviceID}/temp")(handler)
+    app.sub("commands/reboot")(handler)
+    app.unsub("sensors/{deviceID}/temp")
+
+    assert calls == [
+        ("subscribe", [("sensors/+/temp", 1)]),
+        ("subscribe", [("commands/reboot", 1)]),
+        ("unsubscribe", ["sensors/+/temp"]),
+    ]
+
+
+def test_conflicting_parameter_names_are_rejected():
+    router = Router()
+
+    @router.sub("devices/{deviceID}/status")
+    def handle_device(request: Request):
+        return JsonResponse(data=request.params)
+
+    with pytest.raises(ValueError, match="conflicts with devices/{deviceID}/status"):
+        router.sub("devices/{name}/status")(handler)
+    with pytest.raises(ValueError, match="conflicts"):
+        router.sub("devices/+/status")(handler)
+
+    # Unsubscribing another pattern on the same topics leaves the route alone
+    router.unsub("devices/{name}/status")
+    route = router.routes.get("devices/{deviceID}/status")
+    assert route is not None and route.handlers == (handle_device,)
+    assert router.routes.get("devices/{name}/status") is None
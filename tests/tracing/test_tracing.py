@@ -0,0 +1,156 @@
+import json
+import threading
+import time
+
+from mqute import MQute, Router, Request, Response, JsonResponse, Tracer, InMemorySpanExporter, FileSpanExporter
+from mqute.tracing import SpanContext, TRACEPARENT
+
+PARENT = SpanContext(trace_id="4bf92f3577b34da6a3ce929d0e0e4736", span_id="00f067aa0ba902b7", sampled=True)
+
+
+def test_traceparent_round_trip():
+    assert SpanContext.from_traceparent(PARENT.to_traceparent()) == PARENT
+    assert SpanContext.from_traceparent("garbage") is None
+    assert SpanContext.from_traceparent("00-xyz-00f067aa0ba902b7-01") is None
+
+
+def test_router_records_middleware_and_handler_spans():
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter)
+    router = Router()
+
+    @router.middleware
+    def passthrough(request: Request):
+        return request
+
+    @router.sub("devices/status")
+    def handle_status(request: Request):
+        return JsonResponse(data={"ok": True})
+
+    responses = []
+    root = tracer.start_span("root")
+    with root:
+        router.route(Request("devices/status", {}, resolve=responses.append, span=root))
+    tracer.flush()
+
+    names = [span.name for span in exporter.spans]
+    assert names == ["middleware passthrough", "handler handle_status", "root"]
+    assert all(span.context.trace_id == root.context.trace_id for span in exporter.spans)
+    assert exporter.spans[1].parent_id == root.context.span_id
+
+
+def test_incoming_context_is_continued_and_injected_into_reply(make_app, make_message, deliver):
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter)
+    app, published, _ = make_app(tracer=tracer)
+
+    @app.sub("devices/status")
+    def handle_status(request: Request):
+        return JsonResponse(data={"ok": True})
+
+    deliver(app, make_message(
+        "devices/status", b"{}", {TRACEPARENT: PARENT.to_traceparent()}
+    ))
+    tracer.flush()
+
+    assert len(published) == 1
+    injected = SpanContext.from_traceparent(published[0].user_properties[TRACEPARENT])
+    assert injected.trace_id == PARENT.trace_id
+    receive = [span for span in exporter.spans if span.name.startswith("receive")][0]
+    assert receive.parent_id == PARENT.span_id
+    publish = [span for span in exporter.spans if span.name.startswith("publish")][0]
+    assert publish.context.span_id == injected.span_id
+
+
+def test_unsampled_traces_are_propagated_but_not_exported(make_app, make_message, deliver):
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter, sample_rate=0.0)
+    app, published, _ = make_app(tracer=tracer)
+
+    @app.sub("devices/status")
+    def handle_status(request: Request):
+        return JsonResponse(data={"ok": True})
+
+    deliver(app, make_message("devices/status", b"{}"))
+    tracer.flush()
+
+    assert exporter.spans == []
+    injected = SpanContext.from_traceparent(published[0].user_properties[TRACEPARENT])
+    assert injected.sampled is False
+
+
+def test_file_exporter_writes_json_lines(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(FileSpanExporter(str(path)))
+    with tracer.start_span("work") as span:
+        span.set_attribute("topic", "a/b")
+    tracer.shutdown()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 1
+    assert records[0]["name"] == "work"
+    assert records[0]["attributes"] == {"topic": "a/b"}
+
+
+class FailingExporter(InMemorySpanExporter):
+    def export(self, spans):
+        super().export(spans)
+        raise ValueError("I/O operation on closed file")
+
+
+def test_spans_are_exported_in_batches_off_thread():
+    threads = []
+
+    class RecordingExporter(InMemorySpanExporter):
+        def export(self, spans):
+            threads.append((threading.current_thread().name, len(spans)))
+            super().export(spans)
+
+    exporter = RecordingExporter()
+    tracer = Tracer(exporter, batch_size=10, export_interval=5)
+    for i in range(25):
+        with tracer.start_span(f"work {i}"):
+            pass
+
+    deadline = time.monotonic() + 5
+    while len(exporter.spans) < 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert threads == [("mqute-span-exporter", 10), ("mqute-span-exporter", 10)]
+    tracer.shutdown()
+    assert len(exporter.spans) == 25 and threads[-1][1] == 5
+
+
+def test_exporter_errors_never_reach_handlers(make_app, make_message, deliver):
+    exporter = FailingExporter()
+    tracer = Tracer(exporter)
+    app, published, _ = make_app(tracer=tracer)
+
+    @app.sub("devices/status")
+    def handle_status(request: Request):
+        return JsonResponse(data={"ok": True})
+
+    deliver(app, make_message("devices/status", b"{}"))
+    tracer.flush()
+    assert len(published) == 1 and len(exporter.spans) > 0
+
+
+def test_tracing_survives_disconnect_and_reconnect(tmp_path, make_app, make_message, deliver):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(FileSpanExporter(str(path)))
+    app, published, _ = make_app(tracer=tracer)
+
+    @app.sub("devices/status")
+    def handle_status(request: Request):
+        return JsonResponse(data={"ok": True})
+
+    deliver(app, make_message("devices/status", b"{}"))
+    app.disconnect()
+    deliver(app, make_message("devices/status", b"{}"))
+    tracer.shutdown()
+
+    assert len(published) == 2
+    assert sum(json.loads(line)["name"].startswith("receive") for line in path.read_text().splitlines()) == 2
+
+    # Spans finished after shutdown are dropped rather than written to the closed file
+    with tracer.start_span("late"):
+        pass
@@ -0,0 +1,181 @@
+import time
+
+import pytest
+from mqute import Router, Request, Response, JsonResponse
+from mqute.window import ClosedWindow, WindowAggregator, parse_duration
+
+
+def test_parse_duration():
+    assert parse_duration("10s") == 10.0
+    assert parse_duration("500ms") == 0.5
+    assert parse_duration("2m") == 120.0
+    assert parse_duration(3) == 3.0
+    with pytest.raises(ValueError):
+        parse_duration("0s")
+
+
+def test_window_size_must_be_multiple_of_slide():
+    with pytest.raises(ValueError):
+        WindowAggregator(size=10, slide=3)
+    with pytest.raises(ValueError):
+        WindowAggregator(size=10, aggregates=["median"])
+
+
+def test_tumbling_window_closes_on_next_window():
+    aggregator = WindowAggregator(size=10, aggregates=["count", "mean", "min", "max"])
+    assert aggregator.add("a", 1.0, 0.0) == []
+    assert aggregator.add("a", 3.0, 5.0) == []
+    assert aggregator.add("a", 8.0, 9.9) == []
+    closed = aggregator.add("a", 100.0, 10.0, context="ctx")
+    assert closed == [ClosedWindow("a", {"start": 0.0, "end": 10.0, "count": 3, "mean": 4.0, "min": 1.0, "max": 8.0})]
+
+
+def test_sliding_window_emits_every_slide():
+    aggregator = WindowAggregator(size=3, slide=1, aggregates=["sum"])
+    closed = []
+    for second in range(5):
+        closed += aggregator.add("a", float(second), second + 0.5)
+    assert [(window["start"], window["end"], window["sum"]) for _, window, _ in closed] == [
+        (-2.0, 1.0, 0.0), (-1.0, 2.0, 1.0), (0.0, 3.0, 3.0), (1.0, 4.0, 6.0),
+    ]
+
+
+def test_gaps_only_emit_windows_with_data():
+    aggregator = WindowAggregator(size=2, slide=1, aggregates=["count"], idle_timeout=1000)
+    aggregator.add("a", 1.0, 0.5)
+    closed = aggregator.add("a", 1.0, 100.5)
+    assert [(window["start"], window["end"]) for _, window, _ in closed] == [(-1.0, 1.0), (0.0, 2.0)]
+
+
+def test_sliding_min_max_follow_expiring_panes():
+    aggregator = WindowAggregator(size=3, slide=1, aggregates=["min", "max", "mean"])
+    values = [5.0, 1.0, 9.0, 3.0, 4.0, 2.0, 2.0]
+    closed = []
+    for second, value in enumerate(values):
+        closed += aggregator.add("a", value, second + 0.5)
+    windows = [window for _, window, _ in closed]
+    for window in windows:
+        expected = values[max(0, int(window["start"])):int(window["end"])]
+        assert (window["min"], window["max"]) == (min(expected), max(expected))
+        assert window["mean"] == pytest.approx(sum(expected) / len(expected))
+
+
+def test_catch_up_after_gap_is_capped_and_fast():
+    aggregator = WindowAggregator(size=3600, slide=1, aggregates=["count"], max_catchup=4)
+    for second in range(3600):
+        aggregator.add("a", 1.0, second + 0.5)
+    started = time.perf_counter()
+    closed = aggregator.add("a", 1.0, 3600 + 5000.5)
+    elapsed = time.perf_counter() - started
+    assert [window["count"] for _, window, _ in closed] == [3600, 3599, 3598, 3597]
+    assert elapsed < 0.05
+
+    # The skipped windows expired, so only the new value remains
+    closed = aggregator.add("a", 1.0, 3600 + 5001.5)
+    assert [window["count"] for _, window, _ in closed] == [1]
+
+
+def test_keys_are_bounded_and_idle_keys_evicted():
+    aggregator = WindowAggregator(size=10, max_keys=2, idle_timeout=30)
+    aggregator.add("a", 1.0, 0.0)
+    aggregator.add("b", 1.0, 1.0)
+    aggregator.add("c", 1.0, 2.0)
+    assert len(aggregator) == 2
+    aggregator.add("c", 1.0, 40.0)
+    assert len(aggregator) == 1
+
+
+def test_router_window_calls_handler_with_aggregates():
+    router = Router()
+    now = [0.0]
+    windows = []
+    responses = []
+
+    @router.window("sensors/{deviceID}/temp", size="10s", slide="5s", agg=["mean", "max"], clock=lambda: now[0])
+    def handle_temperature(request: Request):
+        windows.append((request.params["deviceID"], request.payload))
+        return JsonResponse(data=request.payload)
+
+    for t, device, value in [(0, "a", 20.0), (1, "b", 5.0), (4, "a", 22.0), (6, "a", 30.0)]:
+        now[0] = t
+        router.route(Request(f"sensors/{device}/temp", str(value).encode(), resolve=responses.append))
+
+    assert windows == [("a", {"start": -5.0, "end": 5.0, "mean": 21.0, "max": 22.0})]
+    assert len(responses) == 1 and isinstance(responses[0], JsonResponse)
+
+
+def test_router_window_rejects_non_numeric_payload():
+    router = Router()
+
+    @router.window("sensors/temp", size="1s")
+    def handle_temperature(request: Request):
+        return None
+
+    responses = []
+    router.route(Request("sensors/temp", b"hot", resolve=responses.append))
+    assert "could not convert" in responses[0].error
+
+
+def test_evicted_keys_emit_their_pending_windows():
+    aggregator = WindowAggregator(size=10, aggregates=["count"], idle_timeout=15)
+    aggregator.add("quiet", 1.0, 1.0, context="quiet request")
+    aggregator.add("busy", 1.0, 2.0)
+
+    closed = aggregator.add("busy", 1.0, 20.0)
+    assert ClosedWindow("quiet", {"start": 0.0, "end": 10.0, "count": 1}, "quiet request") in closed
+    assert len(aggregator) == 1
+
+    assert aggregator.expire(25.0) == []
+    assert aggregator.expire(40.0) == [ClosedWindow("busy", {"start": 20.0, "end": 30.0, "count": 1})]
+    assert len(aggregator) == 0
+
+
+def test_router_window_replies_for_evicted_keys_on_their_own_topic():
+    router = Router()
+    now = [0.0]
+    windows = []
+    replies = []
+
+    @router.window("sensors/{deviceID}/temp", size="10s", agg="mean", idle_timeout="10s", clock=lambda: now[0])
+    def handle_temperature(request: Request):
+        windows.append((request.params["deviceID"], request.payload))
+        return JsonResponse(data=request.payload)
+
+    for t, device, value in [(1, "a", 20.0), (2, "b", 5.0), (25, "a", 30.0)]:
+        now[0] = t
+        router.route(Request(
+            f"sensors/{device}/temp", str(value).encode(),
+            resolve=lambda response, device=device: replies.append((device, response)),
+        ))
+
+    assert sorted(windows, key=lambda item: item[0]) == [
+        ("a", {"start": 0.0, "end": 10.0, "mean": 20.0}),
+        ("b", {"start": 0.0, "end": 10.0, "mean": 5.0}),
+    ]
+    assert sorted(device for device, _ in replies) == ["a", "b"]
+
+
+@pytest.mark.parametrize("reply", [None, "none"])
+def test_router_window_replies_alongside_other_handlers(reply):
+    router = Router()
+    now = [0.0]
+    replies = []
+
+    @router.window("sensors/{deviceID}/temp", size="3s", slide="1s", agg="count", clock=lambda: now[0])
+    def handle_temperature(request: Request):
+        return JsonResponse(data=request.payload)
+
+    @router.sub("sensors/#")
+    def tap(request: Request):
+        return None
+
+    if reply is not None:
+        @router.sub("sensors/{deviceID}/temp", reply=reply)
+        def mute(request: Request):
+            return None
+
+    for t in (0.5, 1.5, 10.5):
+        now[0] = t
+        router.route(Request("sensors/a/temp", b"1", resolve=replies.append))
+
+    assert [response.data["end"] for response in replies] == [1.0, 2.0, 3.0, 4.0]